@@ -0,0 +1,78 @@
+import random
+from dataclasses import dataclass, asdict
+from typing import Dict, List, Tuple
+from shop2.domain import Task, Operator, Method
+from shop2.fact import Fact
+from shop2.common import V
+from shop2.conditions import AND, Filter
+
+
+@dataclass(frozen=True)
+class Workload:
+    """
+    Parameters of a synthetic HTN domain and problem.
+
+    depth -- levels of compound tasks above the primitive ones
+    branching -- subtasks per method
+    methods -- methods per compound task
+    state_size -- objects in the initial state
+    filter_density -- probability that a method (other than the last of its
+        task, which keeps every problem solvable) tests a Filter
+    unordered -- probability that a method's subtasks are unordered
+    seed -- seed of the generator
+    """
+    depth: int = 3
+    branching: int = 2
+    methods: int = 2
+    state_size: int = 20
+    filter_density: float = 0.5
+    unordered: float = 0.5
+    seed: int = 0
+
+    @property
+    def name(self) -> str:
+        return '-'.join(f'{key}={value}' for key, value in asdict(self).items())
+
+
+def parity(residue: int):
+    return Filter(lambda v, w: (v + w) % 2 == residue)
+
+
+def generate(workload: Workload) -> Tuple[Dict, object, List]:
+    """
+    Returns a domain ("name/arity" -> [Method/Operator]), state and tasks
+    for a workload.
+
+    Task t<level>(?o) at each level has `methods` methods. Each binds ?o and
+    any other object ?p of the state (so matching grows with the state),
+    optionally filters the pair, and has `branching` subtasks at the next
+    level on ?p and ?o, ordered or not. The primitive tasks are operators
+    that mark their object as visited. The plan has branching ** depth
+    actions.
+    """
+    rng = random.Random(workload.seed)
+    domain = {}
+    for level in range(workload.depth):
+        methods = []
+        for m in range(workload.methods):
+            preconditions = (Fact(name=V('o'), value=V('v')) &
+                             Fact(kind='obj', name=V('p'), value=V('w')))
+            if m < workload.methods - 1 and rng.random() < workload.filter_density:
+                preconditions = preconditions & parity(rng.randrange(2))
+            subtasks = [Task(f't{level + 1}', V('p') if k % 2 == 0 else V('o'))
+                        for k in range(workload.branching)]
+            if rng.random() < workload.unordered:
+                subtasks = tuple(subtasks)
+            methods.append(Method(head=(f't{level}', V('o')), preconditions=preconditions,
+                                  subtasks=subtasks))
+        domain[f't{level}/1'] = methods
+    domain[f't{workload.depth}/1'] = [
+        Operator(head=(f't{workload.depth}', V('o')),
+                 preconditions=Fact(name=V('o'), value=V('v')),
+                 effects=Fact(visited=V('o'))),
+    ]
+
+    state = AND(*[Fact(kind='obj', name=f'o{i}', value=rng.randrange(100))
+                  for i in range(workload.state_size)])
+    tasks = [Task('t0', 'o0')]
+    return domain, state, tasks
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import random
+import sys
+import tracemalloc
+from dataclasses import replace
+from statistics import median
+from time import perf_counter
+from typing import Dict, List
+from shop2.domain import CompiledDomain
+from shop2.planner import find_plan
+from benchmarks.generators import Workload, generate
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+BASE = Workload(depth=4, state_size=50)
+
+AXES = {
+    'depth': (3, 4, 5),
+    'branching': (2, 3),
+    'methods': (1, 2, 4),
+    'state_size': (20, 50, 200),
+    'filter_density': (0.0, 0.5, 1.0),
+    'unordered': (0.0, 0.5, 1.0),
+}
+
+
+def suite(base: Workload = BASE) -> List[Workload]:
+    """
+    Returns the base workload and, for each axis, its variations along that
+    axis alone.
+    """
+    workloads = [base]
+    for axis, values in AXES.items():
+        for value in values:
+            if (workload := replace(base, **{axis: value})) not in workloads:
+                workloads.append(workload)
+    return workloads
+
+
+def measure(workload: Workload, repeat: int = 5, **kwargs) -> Dict:
+    """
+    Plans a workload with `find_plan` (keyword arguments are passed to it)
+    and returns the best and median time over repeat runs, the peak memory
+    of a separate traced run (which also warms up the timed ones), and the
+    plan length. The domain is compiled once, outside the timed runs; the
+    planner's random choices are seeded with the workload's seed.
+    """
+    domain, state, tasks = generate(workload)
+    D = CompiledDomain(domain)
+    random.seed(workload.seed)
+    tracemalloc.start()
+    try:
+        find_plan(state, tasks, D, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        random.seed(workload.seed)
+        start = perf_counter()
+        actions = find_plan(state, tasks, D, **kwargs)
+        times.append(perf_counter() - start)
+    return {'time': min(times), 'median': median(times), 'peak_kib': peak / 1024,
+            'actions': len(actions)}
+
+
+def run(workloads: List[Workload], repeat: int = 5, **kwargs) -> Dict[str, Dict]:
+    results = {}
+    for workload in workloads:
+        results[workload.name] = measure(workload, repeat, **kwargs)
+        print(f"{workload.name}: {results[workload.name]['time'] * 1000:.2f} ms, "
+              f"{results[workload.name]['peak_kib']:.0f} KiB")
+    return results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float = 1.5) -> List[str]:
+    """
+    Returns a description of every workload whose time or peak memory grew
+    by more than threshold times its baseline.
+    """
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        for metric in ('time', 'peak_kib'):
+            ratio = result[metric] / max(baseline[name][metric], 1e-9)
+            if ratio > threshold:
+                regressions.append(f"{name}: {metric} {ratio:.2f}x baseline")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Scaling benchmarks for the SHOP2 planner.")
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save', action='store_true', help="store the results as the baseline")
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help="ratio to the baseline reported as a regression")
+    parser.add_argument('--match', default='random', choices=('random', 'first'))
+    parser.add_argument('--rete', action='store_true')
+    args = parser.parse_args(argv)
+    results = run(suite(), args.repeat, match=args.match, rete=args.rete)
+    if args.save:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save to create one")
+        return 0
+    with open(args.baseline) as f:
+        regressions = compare(results, json.load(f), args.threshold)
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
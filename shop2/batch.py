@@ -0,0 +1,110 @@
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from importlib import import_module
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from shop2.domain import CompiledDomain
+from shop2.planner import find_plan, FailedPlanException
+from shop2.registry import dumps, loads
+
+_domain: Optional[CompiledDomain] = None
+
+
+@dataclass
+class PlanResult:
+    """
+    The outcome of one problem of a batch: the grounded actions of its plan,
+    or the error that prevented finding one (the message of a
+    FailedPlanException, or the type and message of any other exception).
+    """
+    index: int
+    actions: Optional[List[Tuple]] = None
+    error: Optional[str] = None
+
+
+def resolve(domain: Union[str, Dict, CompiledDomain]) -> CompiledDomain:
+    """
+    Compiles a domain given as a dict, a CompiledDomain, or an import path of
+    the form "module:attribute" (e.g., "run:Domain").
+    """
+    if isinstance(domain, str):
+        module, _, attribute = domain.partition(':')
+        domain = getattr(import_module(module), attribute)
+    return domain if isinstance(domain, CompiledDomain) else CompiledDomain(domain)
+
+
+def _initialize(domain) -> None:
+    global _domain
+    _domain = loads(domain) if isinstance(domain, bytes) else resolve(domain)
+
+
+def solve(domain: CompiledDomain, start: int, problems: List[Tuple],
+          kwargs: Dict) -> List[PlanResult]:
+    """
+    Plans each problem in turn, recording an error in its PlanResult instead
+    of letting it abort the rest of the batch.
+    """
+    results = []
+    for index, (state, tasks) in enumerate(problems, start):
+        try:
+            results.append(PlanResult(index, find_plan(state, tasks, domain, **kwargs)))
+        except FailedPlanException as e:
+            results.append(PlanResult(index, error=str(e)))
+        except Exception as e:
+            results.append(PlanResult(index, error=f"{type(e).__name__}: {e}"))
+    return results
+
+
+def _solve(start: int, problems: List[Tuple], kwargs: Dict) -> List[PlanResult]:
+    return solve(_domain, start, problems, kwargs)
+
+
+def plan_many(domain: Union[str, Dict, CompiledDomain], problems: Iterable[Tuple],
+              workers: int = None, chunksize: int = None, **kwargs) -> Iterator[PlanResult]:
+    """
+    Plans many independent (state, tasks) problems in the same domain, in a
+    closed world (see `find_plan`, which receives kwargs), across a pool of
+    worker processes. Yields a PlanResult per problem as soon as its chunk is
+    done, so results are not in the order of the problems. A problem that
+    fails, with any exception, gets a PlanResult with its error, and the
+    rest of the batch goes on.
+
+    A domain object is compiled once, here, and sent to each worker
+    serialized with `shop2.registry.dumps`, which requires its Filter and
+    effect functions to be registered (see `shop2.registry.register`). A
+    domain with unregistered lambdas is handed to the workers by forking
+    instead, where the platform supports it; elsewhere, or to have each
+    worker import and compile it itself, pass the domain as an import path
+    ("module:attribute"). Problems are sent in
+    chunks of chunksize (by default, about four chunks per worker) to amortize
+    the cost of shipping them. workers defaults to the number of CPUs; with
+    workers=1, problems are solved in this process.
+    """
+    problems = list(problems)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from solve(resolve(domain), 0, problems, kwargs)
+        return
+
+    if chunksize is None:
+        chunksize = max(1, -(-len(problems) // (workers * 4)))
+    context, payload = multiprocessing.get_context(), domain
+    if not isinstance(domain, str):
+        domain = resolve(domain)
+        try:
+            payload = dumps(domain)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            if 'fork' not in multiprocessing.get_all_start_methods():
+                raise ValueError("Register the domain's functions (see shop2.registry) or pass the "
+                                 "domain as an import path ('module:attribute') on platforms that "
+                                 "cannot fork") from None
+            context, payload = multiprocessing.get_context('fork'), domain
+
+    with ProcessPoolExecutor(workers, mp_context=context, initializer=_initialize,
+                             initargs=(payload,)) as pool:
+        futures = [pool.submit(_solve, start, problems[start:start + chunksize], kwargs)
+                   for start in range(0, len(problems), chunksize)]
+        for future in as_completed(futures):
+            yield from future.result()
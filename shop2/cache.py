@@ -0,0 +1,91 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Tuple
+from py_plan.pattern_matching import index_key, is_negated_term, is_functional_term
+from shop2.domain import Method
+from shop2.query import compilable
+from shop2.state import MASK
+from shop2.utils import iterTasks
+
+
+class DecompositionCache:
+    """
+    Size-bounded LRU memo of method decompositions, meant to be shared by
+    planner runs in the same process.
+
+    A decomposition is keyed on the task and a canonical fingerprint of the
+    facts that the preconditions of the task's methods and operators could
+    match: the triples found under each of their patterns in the working
+    memory, grouped by fact and hashed by content, so the key does not
+    depend on fact identities or on facts no precondition looks at. The
+    value is the index of the chosen method among the task's alternatives
+    and its grounded subtasks; the planner only stores a decomposition once
+    its subtasks have all been accomplished. Decompositions whose subtasks mention a fact
+    identifier are not cached, since identifiers differ between states.
+    """
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+        self.patterns: Dict[Tuple, Optional[Tuple]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def relevant(self, actions: Tuple) -> Optional[Tuple]:
+        """
+        Returns the triple patterns the preconditions of actions could match,
+        or None if some precondition cannot be looked up in the index.
+        """
+        if actions not in self.patterns:
+            terms = [t for action in actions for query in action.queries for t in query.terms
+                     if not is_functional_term(t)]
+            triples = tuple(set(t[1] if is_negated_term(t) else t for t in terms))
+            self.patterns[actions] = triples if compilable(triples, ()) else None
+        return self.patterns[actions]
+
+    def key(self, actions: Tuple, task, wm) -> Optional[Tuple[Hashable, frozenset]]:
+        """
+        Returns the cache key for decomposing task in working memory wm and
+        the identifiers of the facts it covers, or None if the task cannot be
+        cached.
+        """
+        if not any(isinstance(action, Method) for action in actions):
+            return None
+        if (patterns := self.relevant(actions)) is None:
+            return None
+        facts: Dict[str, set] = {}
+        for pattern in patterns:
+            for attribute, identifier, value in wm.index.get(index_key(pattern), ()):
+                facts.setdefault(identifier, set()).add((attribute, value))
+        fingerprint = 0
+        for triples in facts.values():
+            fingerprint = (fingerprint + hash(frozenset(triples))) & MASK
+        return (actions, task, fingerprint), frozenset(facts)
+
+    def get(self, key: Hashable) -> Optional[Tuple[int, object]]:
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, identifiers: frozenset, index: int, subtasks) -> None:
+        if identifiers.intersection(mentions(subtasks)):
+            return
+        self.entries[key] = (index, subtasks)
+        self.entries.move_to_end(key)
+        if self.maxsize is not None and len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+
+def mentions(subtasks) -> set:
+    """
+    Returns the string arguments of the tasks in a structure of subtasks.
+    """
+    return {a for task in iterTasks(subtasks) for a in task.args if isinstance(a, str)}
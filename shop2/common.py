@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from time import perf_counter
+from typing import Iterator
 """
     TODO:
         - Why is fields at the top? is it mutable?
@@ -24,6 +26,59 @@ class V:
     def to_unify_str(self):
         return f"?{ self.name }"
 
+
+class Pause:
+    """
+    Yielded by the planner when it pauses cooperatively; resume it with
+    send(None).
+    """
+    def __repr__(self):
+        return "PAUSE"
+
+
+PAUSE = Pause()
+
+
+class Pacer:
+    """
+    Decides when a planner with a pause interval gives control back to its
+    driver: once interval seconds have passed since the last pause. Besides
+    the checks between steps, the joins call `tick` for every candidate
+    they try (a fact, a partial binding or an activation), and check the
+    clock every `every` candidates, so a long join pauses even while it
+    rejects everything. The Rete network counts the tokens and facts each
+    change visits and can pause between changes (see `Rete.settle`).
+    """
+    def __init__(self, interval: float, every: int = 32):
+        self.interval = interval
+        self.every = every
+        self.count = 0
+        self.deadline = perf_counter() + interval
+
+    def due(self) -> bool:
+        return perf_counter() >= self.deadline
+
+    def reset(self) -> None:
+        self.deadline = perf_counter() + self.interval
+
+    def tick(self, n: int = 1) -> bool:
+        """
+        Counts n candidates and returns whether a pause is due.
+        """
+        before, self.count = self.count, self.count + n
+        return self.count // self.every > before // self.every and self.due()
+
+    def paced(self, bindings: Iterator) -> Iterator:
+        """
+        Passes bindings through, inserting PAUSE whenever the pacer is due,
+        for joins that cannot tick themselves.
+        """
+        for theta in bindings:
+            if self.tick():
+                yield PAUSE
+                self.reset()
+            yield theta
+
 # class V:
 #     """
 #     A variable for pattern matching.
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 from itertools import chain
+from inspect import signature
 from shop2.common import V
 
 if TYPE_CHECKING:
@@ -27,6 +28,9 @@ class ConditionalList(tuple):
     def __new__(cls, *args: List[Union[ConditionalList, ConditionalElement]]):
         return super().__new__(cls, args)
 
+    def __getnewargs__(self):
+        return tuple(self)
+
     def __repr__(self):
         return "{}{}".format(self.__class__.__name__, super().__repr__())
 
@@ -195,16 +199,20 @@ class Filter(ConditionalElement, ComposableCond):
     The code should evalute to a boolean result.
 
     If it does not evaluate to True, then the test fails.
+
+    The variables passed to the code are named by its parameters, or by args
+    when given (e.g., for a function shared by several filters).
     """
 
-    def __init__(self, tmpl: Callable) -> None:
+    def __init__(self, tmpl: Callable, args: Tuple[str, ...] = None) -> None:
         self.tmpl = tmpl
+        self.args = tuple(signature(tmpl).parameters) if args is None else tuple(args)
 
     def __eq__(self, other: object) -> bool:
-        return isinstance(other, Filter) and self.tmpl == other.tmpl
+        return isinstance(other, Filter) and self.tmpl == other.tmpl and self.args == other.args
 
     def __hash__(self):
-        return hash(tuple(['filter', self.tmpl]))
+        return hash(tuple(['filter', self.tmpl, self.args]))
 
 
 class Bind(ConditionalElement, ComposableCond):
@@ -1,15 +1,18 @@
-from random import choice
-import inspect
+from random import random, randrange, shuffle
 from itertools import chain
-from typing import List, Tuple, Set, Dict, Union
+from collections.abc import Mapping
+from typing import Iterator, List, Optional, Tuple, Set, Dict, Union
 from dataclasses import dataclass
 from py_plan.unification import is_variable, unify_var
 from py_plan.unification import execute_functions
-from py_plan.pattern_matching import build_index, pattern_match
+from py_plan.pattern_matching import build_index, pattern_match, contains_variable
 from py_plan.unification import execute_functions, unify
 from shop2.fact import Fact
 from shop2.conditions import AND, OR, NOT, Filter
-from shop2.common import V
+from shop2.common import V, PAUSE, Pacer
+from shop2.state import WorkingMemory, iter_facts
+from shop2.query import Query, split_terms, requirements, compilable, extend, test
+from shop2.rete import term_vars
 
 class Axiom:
     """
@@ -38,31 +41,78 @@ class Method:
     """
     As defined for Method in domain description of SHOP2
     """
-    def __init__(self, head, preconditions, subtasks, cost=1):
+    def __init__(self, head, preconditions, subtasks, cost=1, lazy=False):
         self.head = head
         self.name = head[0]
         self.args = head[1:]
         self.preconditions = preconditions
+        self.ptconditions, self.queries = compile_queries(preconditions, lazy)
         self.subtasks = subtasks
+        self.matcher = HeadMatcher(head)
+        self.template = TaskTemplate(subtasks)
         self.cost = cost # TODO cost = sum of costs of operators in subtasks
 
-    def applicable(self, task, state, plan, visited):
-        ptstate = fact2tuple(state, variables=False)[0]
-        index = build_index(ptstate)
-        substitutions = unify(task.head, self.head)
+    def applicable(self, task, state, plan, visited, rete=None, match='random'):
+        """
+        Returns the grounded subtasks of the method for task in state (a
+        state or a WorkingMemory over it), or False. Each precondition
+        disjunct is tried at most once per state fingerprint and plan key, as
+        recorded in the visited set.
+        """
+        return next(self.alternatives(task, state, plan, visited, rete, match), False)
+
+    def alternatives(self, task, state, plan, visited, rete=None, match='random',
+                     pacer: Pacer = None):
+        """
+        Lazily yields the grounded subtasks for each distinct way the method
+        applies to task, disjunct by disjunct. Within a disjunct, bindings come
+        in random order (match='random', see `shuffled`) or in enumeration
+        order (match='first'); either way they are pulled from the join only
+        as they are needed, resuming the iterator after backtracking never
+        redoes a join, and every alternative is produced exactly once. With a
+        pacer, PAUSE is yielded in between whenever it is due, so the caller
+        can pause in the middle of a long match.
+        """
+        wm = state if isinstance(state, WorkingMemory) else WorkingMemory(state)
+        substitutions = self.matcher.match(task)
+        if substitutions is None:
+            return
         if not self.preconditions:
-            return msubst(substitutions, self.subtasks)
-        ptconditions = fact2tuple(self.preconditions, variables=True)
-        for ptcondition in ptconditions:
-            if (task.name, str(ptcondition), str(state), plan) in visited:
+            yield self.template.ground(substitutions)
+            return
+        seen = set()
+        for i in range(len(self.queries)):
+            if (self, i, wm.fingerprint.value, plan) in visited:
                 continue
-            visited.append((task.name, str(ptcondition),str(state), plan))
-            M = [(self.name, theta) for theta in pattern_match(ptcondition, index, substitutions)] # Find if method's precondition is satisfied for state
-            if M:
-                m, theta = choice(M)
-                return msubst(theta, self.subtasks)
+            visited.add((self, i, wm.fingerprint.value, plan))
+            M = matches(self, i, wm, substitutions, rete, pacer) # Find if method's precondition is satisfied for state
+            if match == 'random':
+                M = shuffled(M)
+            for theta in M:
+                if theta is PAUSE:
+                    yield PAUSE
+                    continue
+                subtasks = self.template.ground(theta)
+                if (key := freeze(subtasks)) not in seen:
+                    seen.add(key)
+                    yield subtasks
 
-        return False
+    def holds(self, task, state, subtasks, rete=None) -> bool:
+        """
+        Checks that the method still decomposes task into subtasks in state,
+        i.e., that some binding of its preconditions grounds to them. Unlike
+        alternatives, this ignores and does not mark the visited set.
+        """
+        wm = state if isinstance(state, WorkingMemory) else WorkingMemory(state)
+        substitutions = self.matcher.match(task)
+        if substitutions is None:
+            return False
+        key = freeze(subtasks)
+        if not self.preconditions:
+            return freeze(self.template.ground(substitutions)) == key
+        return any(freeze(self.template.ground(theta)) == key
+                   for i in range(len(self.queries))
+                   for theta in matches(self, i, wm, substitutions, rete))
 
     def __str__(self):
         s = f"Name: {self.name}\n"
@@ -77,50 +127,111 @@ class Operator:
     """
     As defined for Operator in domain description of SHOP2
     """
-    def __init__(self, head, preconditions, effects, cost=1):
+    def __init__(self, head, preconditions, effects, cost=1, lazy=False):
         self.head = head
         self.name = head[0]
         self.args = head[1:]
         self.preconditions = preconditions
+        self.ptconditions, self.queries = compile_queries(preconditions, lazy)
         self.effects = effects
         self.cost = cost
+        self.matcher = HeadMatcher(head)
 
-        self.add_effects = set()
-        self.del_effects = set()
+        # Insertion-ordered sets, so effects apply in the order they are written.
+        self.add_effects = {}
+        self.del_effects = {}
 
         if isinstance(self.effects, Fact):
-            self.add_effects.add(self.effects)
+            self.add_effects[self.effects] = None
         elif isinstance(self.effects, NOT):
-            self.del_effects.add(self.effects[0])
+            self.del_effects[self.effects[0]] = None
         else:     
             for e in self.effects:
                 if isinstance(e, NOT):
-                    self.del_effects.add(e[0])
+                    self.del_effects[e[0]] = None
                 else:
-                    self.add_effects.add(e)
-
-    def applicable(self, task, state):
-        add_effects, del_effects = set(), set()
-        for effect in self.add_effects:
-            add_effects.add(effect.duplicate())
-        for effect in self.del_effects:
-            del_effects.add(effect.duplicate())
-
-        ptstate = fact2tuple(state, variables=False)[0]
-        index = build_index(ptstate)        
-        substitutions = unify(task.head, self.head)
+                    self.add_effects[e] = None
+
+    def applicable(self, task, state, rete=None, match='random'):
+        """
+        Returns the grounded action (name, args) of the operator for task in
+        state (a state or a WorkingMemory over it), or False.
+        """
+        if (theta := self.bindings(task, state, rete, match)) is None:
+            return False
+        return self.ground(theta)
+
+    def bindings(self, task, state, rete=None, match='random') -> Optional[Dict]:
+        """
+        Returns a substitution under which the operator applies to task in
+        state, or None.
+        """
+        try:
+            next(self.choose(task, state, rete, match))
+        except StopIteration as e:
+            return e.value
+
+    def choose(self, task, state, rete=None, match='random', pacer: Pacer = None):
+        """
+        Generator form of `bindings`, which returns the substitution (or
+        None). With a pacer, it yields PAUSE while matching whenever the
+        pacer is due; without one, it never yields.
+        """
+        wm = state if isinstance(state, WorkingMemory) else WorkingMemory(state)
+        substitutions = self.matcher.match(task)
+        if substitutions is None or not self.preconditions:
+            return substitutions
+        for i in range(len(self.queries)):
+            if (theta := (yield from pick(matches(self, i, wm, substitutions, rete, pacer),
+                                          match))) is not None:
+                return theta
+        return None
+
+    def alternatives(self, task, state, rete=None) -> Iterator[Dict]:
+        """
+        Yields every substitution under which the operator applies to task in
+        state, disjunct by disjunct.
+        """
+        wm = state if isinstance(state, WorkingMemory) else WorkingMemory(state)
+        substitutions = self.matcher.match(task)
+        if substitutions is None:
+            return
         if not self.preconditions:
-            grounded_args = tuple([substitutions[f'?{v.name}'] for v in self.args if f'?{v.name}' in substitutions])
-            return  (self.name, grounded_args)
-        ptconditions = fact2tuple(self.preconditions, variables=True)
-        for ptcondition in ptconditions:
-            A = [(self.name, theta) for theta in pattern_match(ptcondition, index, substitutions)]
-            if A:
-                a, theta = choice(A)
-                grounded_args = tuple([theta[f'?{v.name}'] for v in self.args if f'?{v.name}' in theta]) 
-                return (self.name, grounded_args)
-        return False
-    
+            yield substitutions
+            return
+        for i in range(len(self.queries)):
+            yield from matches(self, i, wm, substitutions, rete)
+
+    def ground(self, theta: Dict) -> Tuple:
+        """
+        Returns the grounded action (name, args) for the operator's head under
+        substitution theta. Constant arguments of the head are kept in place.
+        """
+        return (self.name, tuple(theta.get(f'?{a.name}', a) if isinstance(a, V) else a
+                                 for a in self.args))
+
+    def apply(self, state, theta: Dict):
+        """
+        Returns the state after applying the effects of the operator under
+        substitution theta. Value expressions such as `(lambda x, y: x + y,
+        V('x'), V('y'))` are evaluated, every fact that has all the
+        attributes and values of a grounded delete effect is removed, and the
+        grounded add effects are added as new facts. The given state is not
+        modified.
+        """
+        deleted, added = self.grounded_effects(theta)
+        facts = [fact for fact in iter_facts(state) if not any(deletes(d, fact) for d in deleted)]
+        facts.extend(added)
+        return AND(*facts)
+
+    def grounded_effects(self, theta: Dict) -> Tuple[List[Fact], List[Fact]]:
+        """
+        Returns the grounded delete and add effects of the operator under
+        substitution theta.
+        """
+        return ([ground_fact(effect, theta) for effect in self.del_effects],
+                [ground_fact(effect, theta) for effect in self.add_effects])
+
     def __str__(self):
         s = f"Name: {self.name}\n"
         s += f"Preconditions: {self.preconditions}\n"
@@ -143,6 +254,121 @@ class Task:
     def head(self):
         return (self.name, *self.args)
     
+MATCH_MODES = ('random', 'first')
+
+def select(bindings: Iterator[Dict], match: str = 'random') -> Optional[Dict]:
+    """
+    Picks one of the bindings without building a list of them, or returns
+    None if there are none. match='first' stops at the first binding, and
+    match='random' draws one uniformly at random by reservoir sampling in a
+    single pass.
+    """
+    try:
+        next(pick(bindings, match))
+    except StopIteration as e:
+        return e.value
+
+def pick(bindings: Iterator[Dict], match: str = 'random'):
+    """
+    Generator form of `select`, which returns the binding picked and yields
+    the PAUSEs found among the bindings (see `shop2.common.Pacer`).
+    """
+    if match not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode {match!r}, expected one of {MATCH_MODES}")
+    selected, n = None, 0
+    for theta in bindings:
+        if theta is PAUSE:
+            yield PAUSE
+            continue
+        if match == 'first':
+            return theta
+        n += 1
+        if random() * n < 1:
+            selected = theta
+    return selected
+
+SHUFFLE_WINDOW = 256
+
+def shuffled(bindings: Iterator[Dict], window: int = SHUFFLE_WINDOW) -> Iterator[Dict]:
+    """
+    Lazily yields bindings in random order, holding at most window of them:
+    each one yielded is drawn uniformly from a buffer that is refilled from
+    the iterator. With at most window bindings this is a uniform shuffle;
+    beyond that, a binding can only come out once it has entered the
+    buffer, so the order favors the earlier ones, in exchange for never
+    materializing the whole join. PAUSEs are passed on as they come.
+    """
+    buffer = []
+    for theta in bindings:
+        if theta is PAUSE:
+            yield PAUSE
+        elif len(buffer) < window:
+            buffer.append(theta)
+        else:
+            i = randrange(len(buffer))
+            yield buffer[i]
+            buffer[i] = theta
+    shuffle(buffer)
+    yield from buffer
+
+def matches(action, i, wm, substitutions, rete=None, pacer: Pacer = None):
+    """
+    Yields the substitutions that satisfy the i-th precondition disjunct of a
+    Method or Operator in WorkingMemory wm. The activations of a Rete network
+    over the same working memory are used when it supports the disjunct,
+    otherwise the disjunct's join plan is run against the index. Calls and
+    bindings are counted in the working memory's stats, if any. With a
+    pacer, the join counts the candidates it tries and PAUSE is interleaved
+    with the substitutions when the pacer is due (see `shop2.common.Pacer`);
+    `pattern_match` can only be paced by the bindings it yields.
+    """
+    query = action.queries[i]
+    if rete is not None and rete.supports(action, i, substitutions):
+        bindings = rete.matches(action, i, substitutions, pacer)
+    elif query.supports(substitutions):
+        bindings = query.match(wm.index, substitutions, pacer)
+    else:
+        bindings = chain.from_iterable(pattern_match(ptcondition, wm.index, substitutions)
+                                       for ptcondition in query.disjuncts())
+        if pacer is not None:
+            bindings = pacer.paced(bindings)
+    if wm.stats is not None:
+        bindings = wm.stats.matched(bindings)
+    return bindings
+
+def ground_value(value, theta: Dict):
+    """
+    Substitutes theta into an effect value and evaluates any functions in it.
+    Unbound variables are left as they are.
+    """
+    if isinstance(value, V):
+        return theta.get(f'?{value.name}', value)
+    if isinstance(value, tuple):
+        return execute_functions(tuple(ground_value(v, theta) for v in value))
+    return value
+
+def ground_fact(fact: Fact, theta: Dict) -> Fact:
+    new = Fact()
+    new.update((key, ground_value(value, theta)) for key, value in fact.items())
+    return new
+
+def deletes(effect: Fact, fact: Fact) -> bool:
+    """
+    Checks that a fact has every attribute and value of a grounded delete
+    effect.
+    """
+    return all(k in fact and fact[k] == v for k, v in effect.items())
+
+
+def freeze(tasks: Union[Task, List, Tuple]):
+    """
+    Hashable key for a structure of tasks that keeps ordered (list) and
+    unordered (tuple) groups apart.
+    """
+    if isinstance(tasks, Task):
+        return tasks
+    return (type(tasks), tuple(freeze(task) for task in tasks))
+
 def msubst(theta: Dict, tasks: Union[Task, List, Tuple]) -> Union[Task, List, Tuple]:
     """
     Perform substitutions theta on tasks across the structure (of lists and tuples).
@@ -198,31 +424,219 @@ def unify(x, y, s=(), check=False):
         return unify(x[1:], y[1:], unify(x[0], y[0], s, check), check)
     return None
 
+def is_ground(x) -> bool:
+    return not (isinstance(x, (V, tuple)) or is_variable(x))
+
+class HeadMatcher:
+    """
+    Unifier for a method or operator head, compiled once. Each argument is
+    either a constant to compare or a variable to bind, so a ground task is
+    matched in a single pass; anything else falls back to `unify`.
+    """
+    def __init__(self, head):
+        self.head = head
+        self.name = head[0]
+        self.slots = tuple((True, f'?{a.name}') if isinstance(a, V) else (False, a) for a in head[1:])
+        self.generic = not all(isinstance(a, V) or is_ground(a) for a in head[1:])
+
+    def match(self, task: Task) -> Optional[Dict]:
+        if task.name != self.name or len(task.args) != len(self.slots):
+            return None
+        if self.generic:
+            return unify(task.head, self.head)
+        theta = {}
+        for (var, a), b in zip(self.slots, task.args):
+            if not is_ground(b):
+                return unify(task.head, self.head)
+            if not var:
+                if a != b:
+                    return None
+            elif theta.setdefault(a, b) != b:
+                return None
+        return theta
+
+class TaskTemplate:
+    """
+    Subtasks of a method, compiled once into plain data so grounding them
+    under a substitution is a single walk that only looks up variables (same
+    result as `msubst`).
+    """
+    def __init__(self, tasks: Union[Task, List, Tuple]):
+        self.tasks = tasks
+        self.template = self.compile(tasks)
+
+    def compile(self, tasks):
+        if isinstance(tasks, Task):
+            return (Task, tasks.name, tuple((0, a) if is_ground(a) else
+                                            (1, f'?{a.name}') if isinstance(a, V) else
+                                            (1, a) if is_variable(a) else
+                                            (2, a) for a in tasks.args))
+        return (type(tasks), tuple(self.compile(task) for task in tasks))
+
+    def ground(self, theta: Dict) -> Union[Task, List, Tuple]:
+        return self._ground(self.template, theta)
+
+    def _ground(self, template, theta):
+        if template[0] is Task:
+            return Task(template[1], *[a if kind == 0 else theta.get(a, a) if kind == 1 else subst(theta, a)
+                                       for kind, a in template[2]])
+        return template[0]([self._ground(t, theta) for t in template[1]])
+
+class CompiledDomain(Mapping):
+    """
+    A domain ("name/arity" -> list of Methods and Operators) validated and
+    compiled once. Every task signature gets an integer id, and
+    `alternatives[id]` holds its methods and operators in order, so the
+    planner dispatches a task with one lookup instead of building a string
+    key. Reads as the original dict.
+    """
+    def __init__(self, D: Dict):
+        self.ids: Dict[Tuple[str, int], int] = {}
+        self.names: List[str] = []
+        self.alternatives: List[Tuple] = []
+        for key, actions in D.items():
+            name, sep, arity = key.rpartition('/')
+            if not sep or not arity.isdigit():
+                raise ValueError(f"Domain key {key!r} is not of the form 'name/arity'")
+            for action in actions:
+                if not isinstance(action, (Method, Operator)):
+                    raise TypeError(f"{action!r} under {key!r} is not a Method or Operator")
+                if action.name != name or len(action.args) != int(arity):
+                    raise ValueError(f"Head of {action!r} does not match domain key {key!r}")
+            self.ids[(name, int(arity))] = len(self.alternatives)
+            self.names.append(key)
+            self.alternatives.append(tuple(actions))
+
+    def id(self, task: Task) -> int:
+        try:
+            return self.ids[(task.name, len(task.args))]
+        except KeyError:
+            raise KeyError(f"{task.name}/{len(task.args)}") from None
+
+    def __getitem__(self, key: str) -> Tuple:
+        name, _, arity = key.rpartition('/')
+        return self.alternatives[self.ids[(name, int(arity))]]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
 def fact2tuple(facts, variables=False):
     if isinstance(facts, Fact):
         facts = AND(facts)
     all_tuple_state = list()
     for f in generateLogics(facts):
-        tuple_state = set()
+        tuple_state = {}  # insertion-ordered, so join plans do not depend on hashing
         subfacts = flatten([f])
         for fact in subfacts:
             if isinstance(fact, Filter):
-                vars = list(inspect.signature(fact.tmpl).parameters.keys())
-                tuple_state.add((fact.tmpl, *[f'?{var}' for var in vars]))
+                tuple_state[(fact.tmpl, *[f'?{arg}' for arg in fact.args])] = None
                 continue
             elif isinstance(fact, NOT):
                 for cond in fact[0].conds:
                     value = f'?{cond.value.name}' if isinstance(cond.value, V) else cond.value
                     identifier = f'?{cond.identifier.name}'
-                    tuple_state.add(('not', (cond.attribute, identifier, value)))
+                    tuple_state[('not', (cond.attribute, identifier, value))] = None
             else: 
                 for cond in fact.conds:
                     value = f'?{cond.value.name}' if isinstance(cond.value, V) else cond.value
                     identifier = f'?{cond.identifier.name}' if variables else cond.identifier.name
-                    tuple_state.add((cond.attribute, identifier, value))
+                    tuple_state[(cond.attribute, identifier, value)] = None
         all_tuple_state.append(tuple_state)
     return all_tuple_state
 
+def compile_conditions(preconditions) -> Tuple[Tuple, ...]:
+    """
+    Compiles preconditions once into their disjunctive normal form, one tuple
+    of py_plan patterns per disjunct, so matching does not need to rebuild
+    them on every call.
+    """
+    if not preconditions:
+        return ()
+    return tuple(tuple(ptcondition) for ptcondition in fact2tuple(preconditions, variables=True))
+
+def compile_queries(preconditions, lazy=False) -> Tuple[Tuple, Tuple]:
+    """
+    Compiles preconditions into (ptconditions, queries). Normally there is
+    one join plan per DNF disjunct. With lazy, the preconditions are instead
+    evaluated by a single Factorized query and never expanded; it yields
+    the same bindings in another order, so it is only used when asked for.
+    """
+    if lazy and preconditions:
+        return (), (Factorized(preconditions),)
+    ptconditions = compile_conditions(preconditions)
+    return ptconditions, tuple(Query(ptcondition) for ptcondition in ptconditions)
+
+class Factorized:
+    """
+    Evaluates preconditions over their AND/OR structure instead of their DNF.
+
+    The patterns of a conjunction are joined once and their bindings shared
+    by every branch of the ORs under it, and each branch of an OR is
+    enumerated in turn under those bindings, so every binding of the DNF is
+    produced (in a different order). Bindings are generated lazily: a caller
+    that only needs the first one (match='first', `applicable`) stops at the
+    first satisfied branch, and wide ORs cost roughly what they match rather
+    than the product of their branch counts. Tests run as soon as every
+    variable any branch could bind for them is bound.
+    """
+    def __init__(self, preconditions):
+        self.preconditions = preconditions
+        terms = []
+        self.root = self.conjunction([preconditions], terms)
+        self.terms = tuple(terms)
+        positives, tests = split_terms(terms)
+        self.requirements = dict(requirements(tests, set().union(*[term_vars(t) for t in positives])))
+        self.compiled = compilable(positives, tests)
+
+    def conjunction(self, conjuncts, terms):
+        positives, tests, children = [], [], []
+        for c in conjuncts:
+            if isinstance(c, AND):
+                node = self.conjunction(c, terms)
+                positives.extend(node[1])
+                tests.extend(node[2])
+                children.extend(node[3])
+            elif isinstance(c, OR):
+                children.append(('or', tuple(self.conjunction([b], terms) for b in c)))
+            else:
+                p, t = split_terms(fact2tuple(AND(c), variables=True)[0])
+                positives.extend(p)
+                tests.extend(t)
+                terms.extend(p + t)
+        return ('and', tuple(positives), tuple(tests), tuple(children))
+
+    def supports(self, substitution: Dict) -> bool:
+        return self.compiled and not any(contains_variable(v) for v in substitution.values())
+
+    def disjuncts(self):
+        for conjuncts in iterLogics(self.preconditions):
+            yield tuple(fact2tuple(AND(*conjuncts), variables=True)[0])
+
+    def match(self, index, substitution=None, pacer: Pacer = None):
+        bindings = dict(substitution) if substitution else {}
+        yield from self.solve(index, bindings, (self.root,), (), pacer)
+
+    def solve(self, index, bindings, agenda, pending, pacer=None):
+        if not agenda:
+            if test(index, bindings, pending, force=True) is not None:
+                yield bindings
+            return
+        node, rest = agenda[0], agenda[1:]
+        if node[0] == 'or':
+            for branch in node[1]:
+                yield from self.solve(index, bindings, (branch,) + rest, pending, pacer)
+        else:
+            _, positives, tests, children = node
+            tests = pending + tuple((t, self.requirements[t]) for t in tests)
+            for found in extend(index, bindings, positives, tests, pacer):
+                if found is PAUSE:
+                    yield PAUSE
+                else:
+                    yield from self.solve(index, found[0], children + rest, found[1], pacer)
+
 def flatten(struct):
     if not isinstance(struct, (list, tuple)) or isinstance(struct, NOT):
         return struct
@@ -272,6 +686,27 @@ def expandOR(*args):
             result.append(arg)
     return result
 
+def iterLogics(expression):
+    """
+    Lazily yields the disjuncts of the DNF of expression, as flat lists of
+    facts, negations and filters, in the same order as generateLogics.
+    """
+    if isinstance(expression, AND):
+        yield from iterConjunction(tuple(expression))
+    elif isinstance(expression, OR):
+        for arg in expression:
+            yield from iterLogics(arg)
+    else:
+        yield [expression]
+
+def iterConjunction(args):
+    if not args:
+        yield []
+        return
+    for first in iterLogics(args[0]):
+        for rest in iterConjunction(args[1:]):
+            yield first + rest
+
 def generateLogics(expression):
     if isinstance(expression, AND):
         return expandAND(*[generateLogics(arg) for arg in expression])
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from typing import TYPE_CHECKING
 from itertools import chain
+from inspect import Parameter, Signature
 
 from shop2.conditions import ComposableCond
 from shop2.conditions import Cond
@@ -14,6 +15,30 @@ if TYPE_CHECKING:
     from typing import Optional
 
 
+class Identifier:
+    """
+    Returns the identifier bound to a fact's variable: the identity function,
+    with its one parameter named after the variable (as Bind expects).
+    Unlike a function built with eval, it can be pickled.
+    """
+
+    def __init__(self, var: V) -> None:
+        self.var = var
+
+    def __call__(self, value):
+        return value
+
+    @property
+    def __signature__(self) -> Signature:
+        return Signature([Parameter(self.var.name, Parameter.POSITIONAL_OR_KEYWORD)])
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Identifier) and self.var == other.var
+
+    def __hash__(self):
+        return hash(('identifier', self.var))
+
+
 class Fact(dict, ComposableCond):
 
     def __init__(self, *args, **kwargs) -> None:
@@ -36,13 +61,7 @@ class Fact(dict, ComposableCond):
         if not isinstance(other, V):
             raise ValueError("Can only assign facts to variables")
 
-        fact_id_var = self.gen_var
-        func = eval("lambda {}: {}".format(
-            fact_id_var.name, fact_id_var.name))
-        # b0 = Bind(lambda: 1+1, V('blah'))
-
-        # return AND(self, b0)
-        return AND(self, Bind(func, other))
+        return AND(self, Bind(Identifier(self.gen_var), other))
 
     def duplicate(self) -> Fact:
         """
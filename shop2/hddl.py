@@ -0,0 +1,317 @@
+import hashlib
+import json
+import os
+import pickle
+import re
+from functools import partial
+from typing import Dict, List, Optional, Tuple, Union
+from shop2 import common
+from shop2.common import V
+from shop2.conditions import AND, OR, NOT, Filter
+from shop2.domain import Task, Operator, Method, CompiledDomain
+from shop2.fact import Fact
+
+CACHE_VERSION = b'shop2-hddl-2'
+
+ORDERED = (':ordered-subtasks', ':ordered-tasks')
+UNORDERED = (':subtasks', ':tasks')
+
+
+class HDDLError(ValueError):
+    """Raised for HDDL input the loader cannot translate."""
+
+
+def load_domain(path: str, cache_dir: str = None) -> CompiledDomain:
+    """
+    Loads an HDDL domain (or its JSON equivalent, see `read`) as a
+    CompiledDomain over the usual {"name/arity": [Method/Operator]} dict.
+
+    With cache_dir, the compiled domain (its preconditions already compiled
+    into join plans) is pickled there under the hash of the file contents,
+    and later loads of the same contents unpickle it instead of parsing and
+    compiling again.
+    """
+    return _load_domain(path, cache_dir)[0]
+
+
+def load(domain_path: str, problem_path: str, cache_dir: str = None) -> Tuple[CompiledDomain, AND, List]:
+    """
+    Loads an HDDL domain and problem, and returns (domain, state, tasks) for
+    `planner`. The domain is cached as in `load_domain`.
+    """
+    domain, types, constants = _load_domain(domain_path, cache_dir)
+    state, tasks = translate_problem(read(problem_path), types, constants)
+    return domain, state, tasks
+
+
+def _load_domain(path: str, cache_dir: str = None) -> Tuple[CompiledDomain, Dict, Dict]:
+    with open(path, 'rb') as f:
+        content = f.read()
+    cached = None
+    if cache_dir is not None:
+        suffix = os.path.splitext(path)[1].encode()
+        key = hashlib.sha256(CACHE_VERSION + b'\0' + suffix + b'\0' + content).hexdigest()
+        cached = os.path.join(cache_dir, f'{key}.pickle')
+        if os.path.exists(cached):
+            with open(cached, 'rb') as f:
+                counter, loaded = pickle.load(f)
+            # Unpickled facts keep their generated variables; new ones must not reuse them.
+            common.variable_counter = max(common.variable_counter, counter)
+            return loaded
+
+    loaded = translate_domain(parse(content.decode(), path))
+    if cached is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        tmp = f'{cached}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump((common.variable_counter, loaded), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cached)
+    return loaded
+
+
+def read(path: str) -> List:
+    """
+    Reads an HDDL file, or its JSON equivalent (a .json file holding the same
+    s-expression as nested arrays of strings), into nested lists.
+    """
+    with open(path) as f:
+        return parse(f.read(), path)
+
+
+def parse(text: str, path: str = '') -> List:
+    if path.endswith('.json'):
+        return json.loads(text)
+    tokens = re.findall(r'[()]|[^\s()]+', re.sub(r';[^\n]*', '', text).lower())
+    stack = [[]]
+    for token in tokens:
+        if token == '(':
+            stack.append([])
+        elif token == ')':
+            if len(stack) == 1:
+                raise HDDLError("Unbalanced ')'")
+            expression = stack.pop()
+            stack[-1].append(expression)
+        else:
+            stack[-1].append(token)
+    if len(stack) != 1 or len(stack[0]) != 1:
+        raise HDDLError("Expected a single (define ...) expression")
+    return stack[0][0]
+
+
+def translate_domain(sexpr: List) -> Tuple[CompiledDomain, Dict, Dict]:
+    """
+    Translates a parsed (define (domain ...) ...) into a CompiledDomain, the
+    parent of each type and the type of each constant.
+
+    Methods become Methods of their task, and actions become Operators.
+    Types become unary facts: a parameter `?x - t` adds the precondition
+    Fact(t, ?x), and the problem states Fact(t, o) for each object o of type
+    t or a subtype of t. Atoms (p a b) become Fact(p, a, b), so their
+    arguments are attributes 1, 2, ...; `=` becomes a Filter. Subtasks are
+    ordered as a list when they are totally ordered, left unordered as a
+    tuple when they have no ordering constraints, and otherwise linearized
+    in an order consistent with the constraints.
+    """
+    sections = definition(sexpr, 'domain')
+    types, constants = {}, {}
+    domain: Dict[str, List] = {}
+    for section in sections:
+        kind = section[0]
+        if kind == ':types':
+            types.update(typed(section[1:]))
+        elif kind == ':constants':
+            constants.update(typed(section[1:]))
+        elif kind == ':method':
+            fields = keywords(section[2:])
+            task = fields[':task']
+            head = (task[0], *terms(task[1:]))
+            preconditions = conditions(fields.get(':precondition'), typed(fields.get(':parameters', [])))
+            domain.setdefault(f'{task[0]}/{len(task) - 1}', []).append(
+                Method(head=head, preconditions=preconditions, subtasks=network(fields)))
+        elif kind == ':action':
+            name, fields = section[1], keywords(section[2:])
+            parameters = typed(fields.get(':parameters', []))
+            domain.setdefault(f'{name}/{len(parameters)}', []).append(
+                Operator(head=(name, *[V(p[1:]) for p in parameters]),
+                         preconditions=conditions(fields.get(':precondition'), parameters),
+                         effects=effects(fields.get(':effect'))))
+    return CompiledDomain(domain), types, constants
+
+
+def translate_problem(sexpr: List, types: Dict = None, constants: Dict = None) -> Tuple[AND, List]:
+    """
+    Translates a parsed (define (problem ...) ...) into a state and tasks,
+    given the types and constants of its domain. The goal, if any, is
+    ignored: the plan is for the initial task network.
+    """
+    types = types or {}
+    objects = dict(constants or {})
+    facts, tasks = [], []
+    for section in definition(sexpr, 'problem'):
+        kind = section[0]
+        if kind == ':objects':
+            objects.update(typed(section[1:]))
+        elif kind == ':init':
+            facts.extend(Fact(*atom) for atom in section[1:])
+        elif kind == ':htn':
+            tasks = network(keywords(section[1:]))
+    for obj, kind in objects.items():
+        while kind is not None and kind != 'object':
+            facts.append(Fact(kind, obj))
+            kind = types.get(kind)
+    return AND(*facts), tasks if isinstance(tasks, (list, tuple)) else [tasks]
+
+
+def definition(sexpr: List, kind: str) -> List:
+    if not sexpr or sexpr[0] != 'define' or len(sexpr) < 2 or sexpr[1][0] != kind:
+        raise HDDLError(f"Expected (define ({kind} ...) ...)")
+    return sexpr[2:]
+
+
+def keywords(items: List) -> Dict:
+    return {items[i]: items[i + 1] for i in range(0, len(items) - 1, 2)}
+
+
+def typed(items: List) -> Dict[str, str]:
+    """
+    Returns the type of each name of a typed list such as (?a ?b - t ?c).
+    """
+    result, pending, i = {}, [], 0
+    while i < len(items):
+        if items[i] == '-':
+            result.update((name, items[i + 1]) for name in pending)
+            pending, i = [], i + 2
+        else:
+            pending.append(items[i])
+            i += 1
+    result.update((name, 'object') for name in pending)
+    return result
+
+
+def terms(args: List) -> List:
+    return [V(a[1:]) if a.startswith('?') else a for a in args]
+
+
+def equal(a, b) -> bool:
+    return a == b
+
+
+def different(a, b) -> bool:
+    return a != b
+
+
+def comparison(function, args: List):
+    """
+    Returns a Filter applying function to the values of args, with the
+    constants among them bound first, or its result if they are all
+    constants.
+    """
+    variables = [a[1:] for a in args if a.startswith('?')]
+    constants = [a for a in args if not a.startswith('?')]
+    if not variables:
+        return function(*constants)
+    return Filter(partial(function, *constants) if constants else function, variables)
+
+
+def condition(expression: List):
+    op = expression[0]
+    if op == 'and':
+        parts = [condition(e) for e in expression[1:]]
+        if any(p is False for p in parts):
+            return False
+        return AND(*[p for p in parts if p is not True])
+    if op == 'or':
+        return OR(*[condition(e) for e in expression[1:]])
+    if op == 'not' and expression[1][0] == '=':
+        return comparison(different, expression[1][1:])
+    if op == 'not':
+        return NOT(condition(expression[1]))
+    if op == '=':
+        return comparison(equal, expression[1:])
+    if op in ('forall', 'exists', 'imply', 'when') or op.startswith(':'):
+        raise HDDLError(f"Unsupported HDDL expression ({op} ...)")
+    return Fact(op, *terms(expression[1:]))
+
+
+def conditions(expression: Optional[List], parameters: Dict[str, str]):
+    conds = [Fact(kind, V(name[1:])) for name, kind in parameters.items() if kind != 'object']
+    if expression:
+        translated = condition(expression)
+        if translated is True:
+            pass
+        elif translated is False:
+            raise HDDLError("Precondition is never satisfied")
+        elif isinstance(translated, AND):
+            conds.extend(translated)
+        else:
+            conds.append(translated)
+    return AND(*conds) if conds else []
+
+
+def effects(expression: Optional[List]) -> List:
+    if not expression:
+        return []
+    items = expression[1:] if expression[0] == 'and' else [expression]
+    result = []
+    for item in items:
+        if item[0] == 'not':
+            result.append(NOT(Fact(item[1][0], *terms(item[1][1:]))))
+        elif item[0] in ('forall', 'when'):
+            raise HDDLError(f"Unsupported HDDL effect ({item[0]} ...)")
+        else:
+            result.append(Fact(item[0], *terms(item[1:])))
+    return result
+
+
+def network(fields: Dict) -> Union[List, Tuple]:
+    """
+    Returns the subtasks of a method or an initial task network as a list
+    (ordered) or a tuple (unordered).
+    """
+    ordered = next((fields[k] for k in ORDERED if k in fields), None)
+    items = ordered if ordered is not None else next((fields[k] for k in UNORDERED if k in fields), [])
+    if items and items[0] == 'and':
+        items = items[1:]
+    elif items and isinstance(items[0], str):
+        items = [items]
+    labels, subtasks = [], []
+    for item in items:
+        label, task = (item[0], item[1]) if len(item) == 2 and isinstance(item[1], list) else (None, item)
+        labels.append(label)
+        subtasks.append(Task(task[0], *terms(task[1:])))
+    if ordered is not None:
+        return subtasks
+    constraints = fields.get(':ordering', [])
+    if constraints and constraints[0] == 'and':
+        constraints = constraints[1:]
+    elif constraints:
+        constraints = [constraints]
+    if not constraints:
+        return tuple(subtasks)
+    return linearize(labels, subtasks, [(c[1], c[2]) if c[0] == '<' else (c[2], c[1])
+                                        for c in constraints])
+
+
+def linearize(labels: List, subtasks: List, before: List[Tuple]) -> List:
+    """
+    Orders subtasks consistently with (label, label) precedence pairs, in
+    their written order where the constraints allow.
+    """
+    index = {label: i for i, label in enumerate(labels)}
+    successors = {i: [] for i in range(len(subtasks))}
+    counts = [0] * len(subtasks)
+    for a, b in before:
+        successors[index[a]].append(index[b])
+        counts[index[b]] += 1
+    ordered, ready = [], [i for i, n in enumerate(counts) if not n]
+    while ready:
+        i = min(ready)
+        ready.remove(i)
+        ordered.append(subtasks[i])
+        for j in successors[i]:
+            counts[j] -= 1
+            if not counts[j]:
+                ready.append(j)
+    if len(ordered) != len(subtasks):
+        raise HDDLError("Cyclic subtask ordering")
+    return ordered
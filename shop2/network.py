@@ -0,0 +1,240 @@
+from itertools import count
+from typing import Callable, Dict, List, Optional, Tuple, Union
+from shop2.domain import Task
+from shop2.trail import Trail
+
+
+class TaskNetwork:
+    """
+    Partial-order task network compiled into a DAG.
+
+    The network is built from the usual nested structure, where a list orders
+    its elements and a tuple leaves them unordered. Each task instance is a
+    node, and each node counts its open predecessors. The nodes whose count is
+    zero are the frontier (the tasks no other task is constrained to
+    precede). Between two groups of several nodes, a barrier node stands in
+    for the full set of edges, so the DAG stays linear in the size of the
+    structure.
+
+    Completing a task decrements its successors, and a node whose count drops
+    to zero joins the frontier. Decomposing a task splices the subtasks into
+    the DAG in its place: their sources take over the frontier slot, and the
+    task's node becomes a barrier behind their sinks. Both operations cost
+    time proportional to the nodes they touch, not to the size of the
+    network. Nodes are identified by integers, so equal tasks stay distinct
+    instances, and each node records its decomposition depth (the number of
+    decompositions it descends from) and the node it was spliced in for.
+    Decomposed nodes keep their task, so a subtree can be reopened for
+    plan repair. With a trail, every mutation records its inverse, so
+    backtracking restores the network in place.
+    """
+    def __init__(self, T: Union[List, Tuple, Task] = (), trail: Optional[Trail] = None):
+        self.trail = trail
+        self.tasks: Dict[int, Task] = {}
+        self.successors: Dict[int, List[int]] = {}
+        self.predecessors: Dict[int, int] = {}
+        self.depth: Dict[int, int] = {}
+        self.parent: Dict[int, Optional[int]] = {}
+        self.spliced: Dict[int, Task] = {}
+        self.ready: List[int] = []
+        self.position: Dict[int, int] = {}
+        self.ids = count()
+        self.build(T)
+
+    def __len__(self) -> int:
+        return len(self.tasks)
+
+    def __contains__(self, node: int) -> bool:
+        return node in self.tasks
+
+    def __getitem__(self, node: int) -> Task:
+        return self.tasks[node]
+
+    def copy(self) -> 'TaskNetwork':
+        """
+        Returns an independent copy of the network, without a trail. Successor
+        lists are shared, since those of existing nodes are only changed when
+        undoing.
+        """
+        new = TaskNetwork.__new__(TaskNetwork)
+        new.trail = None
+        new.tasks = dict(self.tasks)
+        new.successors = dict(self.successors)
+        new.predecessors = dict(self.predecessors)
+        new.depth = dict(self.depth)
+        new.parent = dict(self.parent)
+        new.spliced = dict(self.spliced)
+        new.ready = list(self.ready)
+        new.position = dict(self.position)
+        new.ids = self.ids
+        return new
+
+    def frontier(self) -> Tuple[Task, ...]:
+        """
+        Returns the tasks which no other task in the network is constrained to
+        precede.
+        """
+        return tuple(self.tasks[node] for node in self.ready)
+
+    def remove(self, node: int) -> None:
+        """
+        Completes the task of a frontier node.
+        """
+        self.do(self._unset_task, self._set_task, node, self.tasks[node])
+        self.complete(node)
+
+    def splice(self, node: int, subtasks: Union[List, Tuple, Task]) -> None:
+        """
+        Replaces the task of a frontier node with subtasks, in place.
+        """
+        task = self.tasks[node]
+        self.do(self._unset_task, self._set_task, node, task)
+        self.do(self._set_spliced, self._unset_spliced, node, task)
+        self.do(self._pop_ready, self._push_ready, node)
+        sinks = self.build(subtasks, self.depth[node] + 1, node)
+        if not sinks:
+            self.complete(node)
+            return
+        for sink in sinks:
+            self.do(self._add_edge, self._remove_edge, sink, node)
+
+    def reopen(self, node: int) -> None:
+        """
+        Drops the open tasks a decomposed node was spliced into and makes its
+        task open again, in the same place. Tasks of the subtree that were
+        already completed stay completed.
+        """
+        pending = set(self.descendants(node))
+        task = self.spliced[node]
+        self.do(self._unset_spliced, self._set_spliced, node, task)
+        self.do(self._set_task, self._unset_task, node, task)
+        while pending:
+            ready = [d for d in pending if d in self.position]
+            if not ready:
+                raise ValueError(f"Cannot reopen node {node}: its subtree has unreachable tasks")
+            for d in ready:
+                pending.discard(d)
+                self.remove(d)
+
+    def descendants(self, node: int) -> List[int]:
+        """
+        Returns the open tasks that descend from a decomposed node.
+        """
+        found = []
+        for d in self.tasks:
+            p = self.parent[d]
+            while p is not None and p != node:
+                p = self.parent[p]
+            if p == node:
+                found.append(d)
+        return found
+
+    def build(self, T: Union[List, Tuple, Task], depth: int = 0, parent: int = None) -> List[int]:
+        """
+        Adds the nodes and edges of a task structure and returns its sinks.
+        """
+        sources, sinks = self.compile(T, depth, parent)
+        for node in sources:
+            if not self.predecessors[node]:
+                self.do(self._push_ready, self._pop_ready, node)
+        return sinks
+
+    def compile(self, T: Union[List, Tuple, Task], depth: int = 0,
+                parent: int = None) -> Tuple[List[int], List[int]]:
+        if isinstance(T, Task):
+            node = self.node(T, depth, parent)
+            return [node], [node]
+        parts = [part for part in (self.compile(t, depth, parent) for t in T) if part[0]]
+        if parts and isinstance(T, list):
+            for (_, before), (after, _) in zip(parts, parts[1:]):
+                self.connect(before, after, parent)
+        if not parts:
+            return [], []
+        if isinstance(T, tuple):
+            return ([node for sources, _ in parts for node in sources],
+                    [node for _, sinks in parts for node in sinks])
+        return parts[0][0], parts[-1][1]
+
+    def connect(self, before: List[int], after: List[int], parent: int = None) -> None:
+        if len(before) > 1 and len(after) > 1:
+            barrier = self.node(None, 0, parent)
+            for u in before:
+                self.do(self._add_edge, self._remove_edge, u, barrier)
+            before = [barrier]
+        for u in before:
+            for v in after:
+                self.do(self._add_edge, self._remove_edge, u, v)
+
+    def node(self, task: Optional[Task], depth: int, parent: int = None) -> int:
+        node = next(self.ids)
+        self.do(self._add_node, self._delete_node, node, depth, parent)
+        if task is not None:
+            self.do(self._set_task, self._unset_task, node, task)
+        return node
+
+    def complete(self, node: int) -> None:
+        if node in self.position:
+            self.do(self._pop_ready, self._push_ready, node)
+        stack = [node]
+        while stack:
+            for successor in self.successors[stack.pop()]:
+                self.do(self._decrement, self._increment, successor)
+                if not self.predecessors[successor]:
+                    if successor in self.tasks:
+                        self.do(self._push_ready, self._pop_ready, successor)
+                    else:
+                        stack.append(successor)
+
+    def do(self, op: Callable, undo: Callable, *args) -> None:
+        op(*args)
+        if self.trail is not None:
+            self.trail.record(undo, *args)
+
+    def _add_node(self, node, depth=0, parent=None):
+        self.successors[node] = []
+        self.predecessors[node] = 0
+        self.depth[node] = depth
+        self.parent[node] = parent
+
+    def _delete_node(self, node, depth=0, parent=None):
+        del self.successors[node]
+        del self.predecessors[node]
+        del self.depth[node]
+        del self.parent[node]
+
+    def _set_spliced(self, node, task):
+        self.spliced[node] = task
+
+    def _unset_spliced(self, node, task):
+        del self.spliced[node]
+
+    def _set_task(self, node, task=None):
+        self.tasks[node] = task
+
+    def _unset_task(self, node, task=None):
+        del self.tasks[node]
+
+    def _add_edge(self, u, v):
+        self.successors[u].append(v)
+        self.predecessors[v] += 1
+
+    def _remove_edge(self, u, v):
+        self.successors[u].pop()
+        self.predecessors[v] -= 1
+
+    def _increment(self, node):
+        self.predecessors[node] += 1
+
+    def _decrement(self, node):
+        self.predecessors[node] -= 1
+
+    def _push_ready(self, node):
+        self.position[node] = len(self.ready)
+        self.ready.append(node)
+
+    def _pop_ready(self, node):
+        i = self.position.pop(node)
+        last = self.ready.pop()
+        if last != node:
+            self.ready[i] = last
+            self.position[last] = i
@@ -1,64 +1,478 @@
-from copy import deepcopy
 from random import choice
-from typing import List, Tuple, Set, Dict, Union, Generator
-from shop2.domain import Task, Axiom, Method, flatten, Operator
-from shop2.utils import replaceHead, replaceTask, removeTask, getT0, generatePermute
+from time import perf_counter
+from typing import Callable, List, Optional, Tuple, Dict, Union
+from shop2.domain import Method, flatten, freeze, Operator, CompiledDomain, MATCH_MODES
+from shop2.utils import VisitedSet
 from shop2.fact import Fact
 from shop2.conditions import AND
+from shop2.trail import Trail, ChoicePoint
+from shop2.network import TaskNetwork
+from shop2.state import WorkingMemory
+from shop2.rete import Rete
+from shop2.search import search
+from shop2.stats import PlannerStats, timer
+from shop2.trace import Tracer, ancestry
+from shop2.common import PAUSE, Pacer
 
 
-def planner(state: Fact, T: Union[List, Tuple], D: Dict):
-    plan = []
-    stack, inner_visited, outer_visited = [], [], []
+def planner(state: Fact, T: Union[List, Tuple], D: Dict, visited_limit: int = None,
+            rete: bool = False, match: str = 'random', simulate: bool = False,
+            strategy: str = 'dfs', heuristic: Callable = None,
+            max_expansions: int = None, time_limit: float = None, max_depth: int = None,
+            deepening: bool = False, pause: float = None, cache=None, repair: bool = False,
+            stats: PlannerStats = None, tracer: Tracer = None):
+    """
+    Coroutine that suggests the next operator to apply for tasks T in domain D.
+
+    D is a domain dict ("name/arity" -> [Method/Operator]) or a
+    CompiledDomain; a dict is validated and compiled once per call, so pass
+    a CompiledDomain to share that work across calls.
+
+    T is a nested list (ordered) / tuple (unordered) of tasks, or a
+    TaskNetwork, which is copied rather than modified. It is compiled into a
+    TaskNetwork, so picking a task that can come first and splicing in a
+    method's subtasks in place only touch the affected nodes. Choice points keep the state by reference instead of
+    copying it, so states sent back by the driver are treated as immutable
+    values (e.g., built with `state & Fact(...)` rather than mutated in
+    place). Changes to the task network and the plan are undone through the
+    trail on backtracking.
+
+    All matching within a step shares one WorkingMemory, which is updated
+    with the delta between successive states. Loop detection keys on its
+    incrementally maintained state fingerprint and a rolling hash of the
+    plan. visited_limit optionally bounds the size of each visited set.
+
+    With rete=True the preconditions of the whole domain are compiled into a
+    Rete network that follows the working memory and keeps the activations
+    for the task arguments it has been asked about, so checking a method or
+    operator looks up its activations instead of joining from scratch.
+
+    Each method choice point keeps the live iterator over the remaining
+    decompositions of its task. Backtracking resumes that iterator, and then
+    the task's later methods, before falling back to the other tasks that
+    could come first and finally to earlier choice points, so every binding
+    of a method is explored once and no join is recomputed.
+
+    With simulate=True the planner assumes a closed world: it applies the
+    effects of each operator to the state itself instead of yielding the
+    action to the driver, and runs to completion in a single step (see
+    `find_plan`).
+
+    strategy='dfs' is the depth-first search above. In a closed world,
+    strategy may instead be 'ucs', 'astar' or 'bnb' to search for a cheap
+    plan by method and operator costs, with an optional heuristic over the
+    remaining task network (see `shop2.search.search`). These strategies
+    honor max_expansions, time_limit, max_depth, rete and stats; they try
+    every binding, so match='first' does not apply, and the options specific
+    to the depth-first search (visited_limit, deepening, pause, cache,
+    repair and tracer) are rejected.
+
+    The search can be bounded by max_expansions (steps of the main loop),
+    time_limit (seconds of wall-clock time) and max_depth (nested method
+    decompositions). The limits are checked cooperatively at every step; when
+    one runs out, BudgetExceededException reports the longest partial plan
+    reached and the search statistics. With deepening=True (closed world
+    only), the planner runs depth-first with a depth limit of 1, 2, ... (up to
+    max_depth), sharing the expansion and time budgets across iterations.
+
+    With pause set (in seconds), the planner gives control back to its driver
+    about that often by yielding PAUSE, both between steps and while
+    matching a precondition (checked every few bindings, see
+    `shop2.common.Pacer`); the driver resumes it with send(None). This lets an event loop interleave many planners (see
+    `shop2.session.PlanningSession`).
+
+    cache optionally shares a DecompositionCache across planner runs, so a
+    task decomposed before against the same relevant facts reuses that
+    decomposition without matching (see `shop2.cache`).
+
+    With repair=True (driver mode only), a task that fails at a fresh step,
+    e.g. because the driver reported success=False or sent a state that
+    invalidates its preconditions, is repaired in place instead of
+    backtracking chronologically. The planner keeps the decomposition tree,
+    checks which of the failed task's ancestors were decomposed by a method
+    that no longer yields the same subtasks in the new state, and reopens
+    the highest such ancestor (or the task's parent, if none was
+    invalidated): its open subtasks are dropped and it is decomposed again
+    next, from the current state. Tasks elsewhere in the network and actions
+    already executed are kept, so replanning is proportional to the
+    disrupted subtree. When the failed task has no parent, or the
+    re-decomposition fails all the way up, the planner backtracks as usual.
+
+    stats optionally collects counters and timers for the depth-first search
+    in a PlannerStats, which the caller can read between steps (see
+    `shop2.stats`). tracer optionally records a span for every method
+    expansion and operator application, nested along the task hierarchy, to
+    export as a flamegraph (see `shop2.trace`).
+
+    match selects how a binding is picked when several satisfy a
+    precondition: 'random' (uniformly, the default; a method shuffles its
+    bindings lazily within a bounded window, see `shop2.domain.shuffled`) or
+    'first' (the first one found, deterministically, without enumerating the
+    rest). It also selects which of the tasks that could come next is
+    decomposed first: one at random, or the first in the network's ready
+    list, which does not depend on chance or hashing.
+    """
+    if match not in MATCH_MODES:
+        raise ValueError(f"Unknown match mode {match!r}, expected one of {MATCH_MODES}")
+    if strategy != 'dfs':
+        if not simulate:
+            raise ValueError(f"Search strategy {strategy!r} requires simulate=True")
+        unsupported = [name for name, value in (('visited_limit', visited_limit),
+                                                ('deepening', deepening), ('pause', pause),
+                                                ('cache', cache), ('repair', repair),
+                                                ('tracer', tracer), ('match', match == 'first'))
+                       if value not in (None, False)]
+        if unsupported:
+            raise ValueError(f"Search strategy {strategy!r} does not support "
+                             f"{', '.join(unsupported)}")
+        budget = Budget(max_expansions, time_limit)
+        budget.stats['iterations'] += 1
+        if (result := search(state, T, D, strategy, heuristic, budget=budget, max_depth=max_depth,
+                             rete=rete, stats=stats)) is None:
+            raise FailedPlanException(message="No valid plan found")
+        raise StopException(result.plan, actions=result.actions, state=result.state,
+                            bindings=result.bindings)
+    if repair and simulate:
+        raise ValueError("Plan repair requires the driver (simulate=False)")
+    D = D if isinstance(D, CompiledDomain) else CompiledDomain(D)
+    budget = Budget(max_expansions, time_limit)
+    if not deepening:
+        budget.stats['iterations'] += 1
+        yield from dfs(state, T, D, budget, max_depth, visited_limit, rete, match, simulate, pause,
+                       cache, repair, stats, tracer)
+        return
+    if not simulate:
+        raise ValueError("Iterative deepening requires simulate=True")
+    depth = 0
     while True:
-        if not T:
-            raise StopException(plan)
-        T0 = getT0(T)
-        task = choice(T0) 
+        depth += 1
+        budget.stats['iterations'] += 1
+        try:
+            yield from dfs(state, T, D, budget, depth, visited_limit, rete, match, simulate, pause,
+                           cache, False, stats, tracer)
+        except BudgetExceededException as e:
+            if e.reason != 'depth' or (max_depth is not None and depth >= max_depth):
+                raise
+
+
+def dfs(state, T, D: CompiledDomain, budget: 'Budget', max_depth: int = None,
+        visited_limit: int = None, rete: bool = False, match: str = 'random',
+        simulate: bool = False, pause: float = None, cache=None, repair: bool = False,
+        stats: PlannerStats = None, tracer: Tracer = None):
+    """
+    Depth-first search behind `planner`.
+    """
+    pacer = None if pause is None else Pacer(pause)
+    plan, plan_keys, grounded, bindings = [], [0], [], []
+    longest = ([], [])
+    cutoff = False
+    trail = Trail()
+    wm = WorkingMemory(state, stats)
+    network = Rete(D, wm) if rete else None
+    inner_visited, outer_visited = VisitedSet(visited_limit), VisitedSet(visited_limit)
+    if isinstance(T, TaskNetwork):
+        tasks = T.copy()
+        tasks.trail = trail
+    else:
+        tasks = TaskNetwork(T, trail)
+    decompositions, pending = {}, {}
+    resume = focus = None
+    if tracer is not None:
+        tracer.close()
+    while True:
+        if (reason := budget.step()) is not None:
+            if len(plan) >= len(longest[0]):
+                longest = (list(plan), list(grounded))
+            raise budget.exceeded(reason, *longest)
+        if stats is not None:
+            stats.count('nodes')
+        if pacer is not None and pacer.due():
+            yield PAUSE
+            pacer.reset()
+        if network is not None and network.queue:
+            yield from network.settle(pacer)
+        if resume is None or resume.node is None:
+            if resume is not None:
+                candidates = resume.frontier
+            elif not tasks:
+                raise StopException(plan, actions=grounded, state=state, bindings=bindings)
+            else:
+                candidates = (focus,) if focus is not None else tasks.ready
+            node = candidates[0] if match == 'first' else choice(candidates)
+            if len(candidates) > 1:
+                trail.push(ChoicePoint(tasks, state, frontier=tuple(n for n in candidates if n != node)))
+            start, alternatives, tried, focus, resume = 0, None, None, None, None
+        else:
+            node, start, alternatives, tried = resume.node, resume.index, resume.alternatives, resume.tried
+        task = tasks[node]
         success = False
-        key = f"{ task.name }/{ len(task.args) }"
-        for action in D[key]:
+        if tracer is not None:
+            tracer.enter(ancestry(tasks, node))
+        actions = D.alternatives[D.id(task)]
+        key = None if stats is None else D.names[D.id(task)]
+        cached = None
+        if cache is not None and (max_depth is None or tasks.depth[node] < max_depth):
+            if (cached := cache.key(actions, task, wm)) is not None and resume is None:
+                visit = (cache, task, wm.fingerprint.value, plan_keys[-1])
+                if visit not in inner_visited and (hit := cache.get(cached[0])) is not None:
+                    inner_visited.add(visit)
+                    if stats is not None:
+                        stats.attempt('method', key)
+                        stats.succeed('method', key)
+                    if tracer is not None:
+                        tracer.begin(repr(actions[hit[0]]))
+                        tracer.end(outcome='cached')
+                    trail.push(ChoicePoint(tasks, state, node, 0, None, hit))
+                    tasks.splice(node, hit[1])
+                    if repair:
+                        decompose(trail, decompositions, node, actions[hit[0]], hit[1])
+                    settle(tasks, node, pending, cache)
+                    budget.stats['depth'] = max(budget.stats['depth'], tasks.depth[node] + 1)
+                    continue
+        for j in range(start, len(actions)):
+            action = actions[j]
             if isinstance(action, Operator):
-                if (result := action.applicable(task, state)):
-                    success, state = yield result
+                if stats is not None:
+                    stats.attempt('operator', key)
+                if tracer is not None:
+                    tracer.begin(repr(action))
+                if (theta := (yield from action.choose(task, wm, network, match, pacer))) is not None:
+                    result = action.ground(theta)
+                    if simulate:
+                        success, state = True, action.apply(state, theta)
+                    else:
+                        if tracer is not None:
+                            tracer.begin('driver')
+                        with timer(stats, 'driver'):
+                            success, state = yield result
+                        if tracer is not None:
+                            tracer.end()
+                    with timer(stats, 'update'):
+                        wm.update(state)
                     if success:
-                        T = removeTask(T, task)
+                        if stats is not None:
+                            stats.succeed('operator', key)
+                        tasks.remove(node)
+                        if cache is not None:
+                            settle(tasks, node, pending, cache)
                         plan.append(action)
+                        plan_keys.append(hash((plan_keys[-1], action.name)))
+                        grounded.append(result)
+                        bindings.append(theta)
+                        trail.record(plan.pop)
+                        trail.record(plan_keys.pop)
+                        trail.record(grounded.pop)
+                        trail.record(bindings.pop)
+                    if tracer is not None:
+                        tracer.end(outcome='applied' if success else 'failed', action=result)
                     break
+                if tracer is not None:
+                    tracer.end(outcome='inapplicable')
 
-            elif isinstance(action, Method):
-                if (result := action.applicable(task, state, str(plan), inner_visited)):
+            elif isinstance(action, Method) and max_depth is not None and tasks.depth[node] >= max_depth:
+                cutoff = True
+                if tracer is not None:
+                    tracer.begin(repr(action))
+                    tracer.end(outcome='cutoff')
 
-                    stack.append((deepcopy(T), deepcopy(plan), deepcopy(state)))
-                    subtask = result
-                    T = type(T)([subtask])+removeTask(T, task)
+            elif isinstance(action, Method):
+                if stats is not None:
+                    stats.attempt('method', key)
+                if tracer is not None:
+                    tracer.begin(repr(action))
+                if alternatives is None:
+                    alternatives = action.alternatives(task, wm, plan_keys[-1], inner_visited, network,
+                                                       match, pacer)
+                    if tried is not None and tried[0] == j:
+                        alternatives = excluding(alternatives, tried[1])
+                result = next(alternatives, None)
+                while result is PAUSE:
+                    yield PAUSE
+                    result = next(alternatives, None)
+                if result is not None:
+                    if stats is not None:
+                        stats.succeed('method', key)
+                    if tracer is not None:
+                        tracer.end(outcome='decomposed')
+                    trail.push(ChoicePoint(tasks, state, node, j, alternatives, tried))
+                    tasks.splice(node, result)
+                    if repair:
+                        decompose(trail, decompositions, node, action, result)
+                    if cached is not None:
+                        remember(trail, pending, node, (*cached, j, result))
+                        settle(tasks, node, pending, cache)
+                    budget.stats['depth'] = max(budget.stats['depth'], tasks.depth[node] + 1)
                     success = True
                     break
+                if tracer is not None:
+                    tracer.end(outcome='exhausted')
+                alternatives = None
             
-            if (str(action.head), str(action.preconditions), str(state)) in outer_visited:
+            if (action, wm.fingerprint.value) in outer_visited:
                 break
             else:
-                outer_visited.append((str(action.head), str(action.preconditions), str(state)))
+                outer_visited.add((action, wm.fingerprint.value))
 
         if not success:
-            if stack: 
-                T, plan, state = stack.pop()
-                state = AND(*flatten(state))
+            if (repair and resume is None
+                    and (target := repair_target(tasks, node, decompositions, wm, network)) is not None):
+                if tracer is not None:
+                    tracer.begin('repair', node=target)
+                tasks.reopen(target)
+                if tracer is not None:
+                    tracer.end()
+                focus = target
+                budget.stats['repairs'] += 1
+                if stats is not None:
+                    stats.count('repairs')
+            elif trail:
+                if len(plan) > len(longest[0]):
+                    longest = (list(plan), list(grounded))
+                budget.stats['backtracks'] += 1
+                if stats is not None:
+                    stats.count('backtracks')
+                if tracer is not None:
+                    tracer.begin('backtrack')
+                with timer(stats, 'backtrack'):
+                    resume = trail.pop()
+                if tracer is not None:
+                    tracer.end(node=resume.node)
+                state = AND(*flatten(resume.state))
+                with timer(stats, 'update'):
+                    wm.update(state)
+            elif cutoff:
+                raise budget.exceeded('depth', *longest)
             else:
                 raise FailedPlanException(message="No valid plan found")
+        else:
+            resume = None
                 
 
+def decompose(trail: Trail, decompositions: Dict, node: int, method: Method, subtasks) -> None:
+    """
+    Records the method and subtasks a node was decomposed into, undoably.
+    """
+    remember(trail, decompositions, node, (method, subtasks))
+
+
+def remember(trail: Trail, table: Dict, node: int, value) -> None:
+    """
+    Sets the entry of a node in table, undoably.
+    """
+    if node in table:
+        trail.record(table.__setitem__, node, table[node])
+    else:
+        trail.record(table.pop, node)
+    table[node] = value
+
+
+def settle(tasks: TaskNetwork, node: int, pending: Dict, cache) -> None:
+    """
+    Walks up from a node that was just completed or decomposed and stores in
+    the cache the pending decompositions of every ancestor whose subtree is
+    now done, so that only decompositions that worked are cached.
+    """
+    while node is not None and node not in tasks and not tasks.predecessors[node]:
+        if node in pending:
+            cache.put(*pending[node])
+        node = tasks.parent[node]
+
+
+def excluding(alternatives, subtasks):
+    """
+    Passes on the alternatives other than subtasks, which were taken from a
+    cache and already tried.
+    """
+    key = freeze(subtasks)
+    for result in alternatives:
+        if result is PAUSE or freeze(result) != key:
+            yield result
+
+
+def repair_target(tasks: TaskNetwork, node: int, decompositions: Dict, wm: WorkingMemory,
+                  network: Rete = None) -> Optional[int]:
+    """
+    Returns the decomposed node to reopen when the task of node fails: the
+    highest ancestor whose method no longer yields the same subtasks, or
+    else the node's parent. None when the node has no parent.
+    """
+    target = tasks.parent[node]
+    ancestor = target
+    while ancestor is not None:
+        if ancestor in decompositions:
+            method, subtasks = decompositions[ancestor]
+            if not method.holds(tasks.spliced[ancestor], wm, subtasks, network):
+                target = ancestor
+        ancestor = tasks.parent[ancestor]
+    return target
+
+
+class Budget:
+    """
+    Expansion and wall-clock limits on a planner run, shared by the
+    iterations of iterative deepening, along with the search statistics.
+    """
+    def __init__(self, expansions: int = None, time: float = None):
+        self.expansions = expansions
+        self.start = perf_counter()
+        self.deadline = None if time is None else self.start + time
+        self.stats = {'expansions': 0, 'backtracks': 0, 'depth': 0, 'iterations': 0, 'repairs': 0}
+
+    def step(self) -> Optional[str]:
+        """
+        Counts a step of the main loop and returns the name of the budget that
+        ran out, if any.
+        """
+        if self.expansions is not None and self.stats['expansions'] >= self.expansions:
+            return 'expansions'
+        if self.deadline is not None and perf_counter() > self.deadline:
+            return 'time'
+        self.stats['expansions'] += 1
+        return None
+
+    def snapshot(self) -> Dict:
+        return {**self.stats, 'elapsed': perf_counter() - self.start}
+
+    def exceeded(self, reason: str, plan: List = None,
+                 actions: List = None) -> 'BudgetExceededException':
+        """
+        Returns the exception reporting that the budget named reason ran out,
+        with the longest partial plan reached and a snapshot of the stats.
+        """
+        return BudgetExceededException(plan, actions, stats=self.snapshot(), reason=reason)
+
+
+def find_plan(state: Fact, T: Union[List, Tuple], D: Dict, **kwargs) -> List[Tuple]:
+    """
+    Plans for tasks T in domain D in a closed world, applying operator effects
+    internally, and returns the grounded actions (name, args) of the complete
+    plan. Raises FailedPlanException if there is none. Keyword arguments are
+    passed to `planner`.
+    """
+    try:
+        for _ in planner(state, T, D, simulate=True, **kwargs):
+            pass
+    except StopException as e:
+        return e.actions
+
+
 class StopException(Exception):
     """Exception raised for errors in the execution of a plan.
 
     Attributes:
         plan -- the plan that caused the error
         message -- explanation of the error
+        actions -- the grounded actions (name, args) of the plan
+        state -- the state the plan ends in
+        bindings -- the substitution each operator of the plan was applied with
     """
 
-    def __init__(self, plan=None, message="Task Completed"):
+    def __init__(self, plan=None, message="Task Completed", actions=None, state=None, bindings=None):
         self.plan = plan
         self.message = message
+        self.actions = actions
+        self.state = state
+        self.bindings = bindings
         super().__init__(self.message)
 
     def __str__(self):
@@ -78,4 +492,21 @@ class FailedPlanException(Exception):
         super().__init__(self.message)
 
     def __str__(self):
-        return f'{self.plan} -> {self.message}'
\ No newline at end of file
+        return f'{self.plan} -> {self.message}'
+
+class BudgetExceededException(FailedPlanException):
+    """Exception raised when a planner budget runs out before a plan is found.
+
+    Attributes:
+        plan -- the longest partial plan reached
+        actions -- the grounded actions (name, args) of that partial plan
+        stats -- search statistics (expansions, backtracks, depth, iterations, repairs, elapsed)
+        reason -- the budget that ran out: 'expansions', 'time' or 'depth'
+    """
+
+    def __init__(self, plan=None, actions=None, stats=None, reason=None,
+                 message="The planning budget ran out"):
+        self.actions = actions
+        self.stats = stats
+        self.reason = reason
+        super().__init__(plan, f"{message} ({reason})" if reason else message)
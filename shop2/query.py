@@ -0,0 +1,128 @@
+from typing import Dict, Iterator, Optional, Set, Tuple
+from py_plan.unification import subst, execute_functions
+from py_plan.pattern_matching import index_key, is_negated_term, is_functional_term, contains_variable
+from shop2.common import PAUSE, Pacer
+from shop2.rete import join, term_vars
+
+
+def split_terms(pattern) -> Tuple[Tuple, Tuple]:
+    """
+    Splits compiled terms into positive patterns and tests (negations and
+    filters).
+    """
+    positives = tuple(t for t in pattern if not is_negated_term(t) and not is_functional_term(t))
+    tests = tuple(t for t in pattern if is_negated_term(t) or is_functional_term(t))
+    return positives, tests
+
+
+def requirements(tests, determined: Set[str]) -> Tuple:
+    """
+    Pairs each test with the variables that must be bound before it can run:
+    all of them for a filter, and those some positive pattern can bind for a
+    negation (the others are existential).
+    """
+    return tuple((t, frozenset(term_vars(t) & determined) if is_negated_term(t)
+                     else frozenset(term_vars(t)))
+                 for t in tests)
+
+
+def compilable(positives, tests) -> bool:
+    return all(len(t) == 3 and not any(isinstance(e, tuple) for e in t)
+               for t in tuple(positives) + tuple(t[1] for t in tests if is_negated_term(t)))
+
+
+def extend(index, bindings, positives, tests, pacer: Pacer = None) -> Iterator[Tuple[Dict, Tuple]]:
+    """
+    Joins the positive patterns, most selective first, testing negations and
+    filters as soon as their requirements are bound. Yields each complete
+    binding with the tests that are still waiting on unbound variables.
+    With a pacer, every candidate fact is counted and PAUSE is yielded in
+    between when the pacer is due.
+    """
+    tests = test(index, bindings, tests)
+    if tests is None:
+        return
+    if not positives:
+        yield bindings, tests
+        return
+
+    best, candidates = None, None
+    for t in positives:
+        facts = index.get(index_key(subst(bindings, t)), ())
+        if not facts:
+            return
+        if candidates is None or len(facts) < len(candidates):
+            best, candidates = t, facts
+
+    rest = tuple(t for t in positives if t is not best)
+    for fact in list(candidates):
+        if pacer is not None and pacer.tick():
+            yield PAUSE
+            pacer.reset()
+        if (new := join(bindings, best, fact)) is not None:
+            yield from extend(index, new, rest, tests, pacer)
+
+
+def test(index, bindings, tests, force=False) -> Optional[Tuple]:
+    """
+    Runs the tests whose requirements are bound and returns the rest, or None
+    if one of them fails. With force, negations run with their unbound
+    variables treated as existential, and a filter with unbound variables is
+    an error.
+    """
+    remaining = []
+    for t, requires in tests:
+        if not requires.issubset(bindings) and not (force and is_negated_term(t)):
+            if force:
+                raise Exception("Functionals cannot have existentially "
+                                "quantified variables.")
+            remaining.append((t, requires))
+        elif is_negated_term(t):
+            bterm = subst(bindings, t[1])
+            for fact in index.get(index_key(bterm), ()):
+                if join({}, bterm, fact) is not None:
+                    return None
+        else:
+            result = execute_functions(subst(bindings, t))
+            if result is False:
+                return None
+            if result is not True and result not in index.get(index_key(result), ()):
+                return None
+    return tuple(remaining)
+
+
+class Query:
+    """
+    Join plan for one compiled precondition disjunct.
+
+    Positive patterns are joined one at a time, always choosing next the
+    pattern with the fewest candidate facts in the index under the current
+    bindings, so the most selective join runs first. Negations and filters
+    are tested as soon as their variables are bound, so doomed partial
+    bindings are discarded before the remaining patterns are enumerated.
+    Matches the same bindings as `py_plan.pattern_matching.pattern_match`.
+    """
+    def __init__(self, ptcondition):
+        self.pattern = self.terms = tuple(ptcondition)
+        self.positives, tests = split_terms(self.pattern)
+        self.tests = requirements(tests, set().union(*[term_vars(t) for t in self.positives]))
+        self.compiled = compilable(self.positives, tests)
+
+    def supports(self, substitution: Dict) -> bool:
+        return self.compiled and not any(contains_variable(v) for v in substitution.values())
+
+    def disjuncts(self) -> Iterator[Tuple]:
+        yield self.pattern
+
+    def match(self, index: Dict, substitution: Dict = None, pacer: Pacer = None) -> Iterator[Dict]:
+        """
+        Yields the substitutions that extend substitution and match the
+        pattern against a triple index, and PAUSE when the pacer is due
+        (see `extend`).
+        """
+        bindings = dict(substitution) if substitution else {}
+        for found in extend(index, bindings, self.positives, self.tests, pacer):
+            if found is PAUSE:
+                yield PAUSE
+            elif test(index, found[0], found[1], force=True) is not None:
+                yield found[0]
@@ -0,0 +1,96 @@
+import io
+import pickle
+from importlib import import_module
+from types import FunctionType
+from typing import Any, Callable, Dict
+
+REGISTRY: Dict[str, Callable] = {}
+NAMES: Dict[int, str] = {}
+
+
+def register(func: Callable = None, name: str = None):
+    """
+    Registers a function (e.g., the lambda of a Filter or of an effect value)
+    under a stable name, so that domains, facts and conditions that refer to
+    it can be serialized with `dumps`. The name defaults to
+    "module:qualname"; lambdas and nested functions have no unique qualname
+    and need an explicit one. Returns the function, so it can be used as a
+    decorator or inline, in the module the name points to (here
+    my_tutor/domain.py), so that `lookup` can import it in a fresh process:
+
+        Filter(register(lambda x, y: x < y, 'my_tutor.domain:less'))
+
+    Registering another function under a name replaces the previous one, so
+    reloading a module keeps its names.
+    """
+    def decorate(func: Callable) -> Callable:
+        key = name or f'{func.__module__}:{func.__qualname__}'
+        if name is None and ('<lambda>' in key or '<locals>' in key):
+            raise ValueError(f"{func!r} has no unique qualified name; register it with a name")
+        if key in REGISTRY:
+            NAMES.pop(id(REGISTRY[key]), None)
+        REGISTRY[key] = func
+        NAMES[id(func)] = key
+        return func
+    return decorate if func is None else decorate(func)
+
+
+def lookup(name: str) -> Callable:
+    """
+    Returns the function registered under name. A name of the form
+    "module:qualname" that is not registered yet is resolved by importing
+    the module, which registers its functions, or else by looking the
+    qualname up in it.
+    """
+    if name not in REGISTRY and ':' in name:
+        module, _, qualname = name.partition(':')
+        obj = import_module(module)
+        if name not in REGISTRY:
+            for attribute in qualname.split('.'):
+                obj = getattr(obj, attribute, None)
+            if callable(obj):
+                return obj
+    try:
+        return REGISTRY[name]
+    except KeyError:
+        raise KeyError(f"No function registered as {name!r}") from None
+
+
+class Pickler(pickle.Pickler):
+    """
+    Pickler that stores registered functions by name.
+    """
+    def persistent_id(self, obj: Any):
+        if isinstance(obj, FunctionType):
+            if id(obj) in NAMES:
+                return ('function', NAMES[id(obj)])
+            if obj.__name__ == '<lambda>' or '<locals>' in obj.__qualname__:
+                raise pickle.PicklingError(f"{obj!r} is not registered; name it with "
+                                           "shop2.registry.register")
+        return None
+
+
+class Unpickler(pickle.Unpickler):
+    def persistent_load(self, pid):
+        kind, name = pid
+        if kind != 'function':
+            raise pickle.UnpicklingError(f"Unknown persistent reference {pid!r}")
+        return lookup(name)
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Serializes a domain (a dict or a CompiledDomain), a state, facts or
+    conditions, storing registered functions by name.
+    """
+    buffer = io.BytesIO()
+    Pickler(buffer, pickle.HIGHEST_PROTOCOL).dump(obj)
+    return buffer.getvalue()
+
+
+def loads(data: bytes) -> Any:
+    """
+    Deserializes the output of `dumps`, resolving functions by name (see
+    `lookup`).
+    """
+    return Unpickler(io.BytesIO(data)).load()
@@ -0,0 +1,546 @@
+from collections import deque
+from itertools import product
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from py_plan.unification import is_variable
+from py_plan.pattern_matching import is_negated_term, is_functional_term, contains_variable
+from shop2.common import V, PAUSE, Pacer
+
+
+def term_vars(term) -> Set[str]:
+    """
+    Returns the variables of a compiled positive, negated or functional term.
+    """
+    if is_negated_term(term):
+        return term_vars(term[1])
+    if is_functional_term(term):
+        return set(term[1:])
+    return set(e for e in term if is_variable(e))
+
+
+def join(bindings: Dict, pattern: Tuple, wme: Tuple) -> Optional[Dict]:
+    """
+    Extends bindings so that pattern matches the wme triple, or returns None.
+    """
+    new = None
+    for p, w in zip(pattern, wme):
+        if is_variable(p):
+            if new is not None and p in new:
+                bound = new[p]
+            elif p in bindings:
+                bound = bindings[p]
+            else:
+                if new is None:
+                    new = {}
+                new[p] = w
+                continue
+            if bound != w:
+                return None
+        elif p != w:
+            return None
+    if new is None:
+        return bindings
+    return {**bindings, **new}
+
+
+class Token:
+    """
+    A partial match: the wme matched at a node on top of its parent token.
+    """
+    __slots__ = ('parent', 'node', 'wme', 'bindings', 'children')
+
+    def __init__(self, parent, node, wme, bindings):
+        self.parent = parent
+        self.node = node
+        self.wme = wme
+        self.bindings = bindings
+        self.children: Dict[Token, None] = {}
+        if parent is not None:
+            parent.children[self] = None
+
+
+class AlphaMemory:
+    """
+    The wmes that pass the constant and intra-pattern equality tests of a
+    pattern, in insertion order. Successors are kept descendants first so
+    that a wme shared by a node and one of its ancestors is not joined twice.
+    """
+    def __init__(self, key, equalities):
+        self.key = key
+        self.equalities = equalities
+        self.wmes: Dict[Tuple, None] = {}
+        self.successors = []
+
+    def test(self, wme: Tuple) -> bool:
+        return all(wme[p] == wme[q] for p, q in self.equalities)
+
+
+class BetaNode:
+    def __init__(self, network, parent):
+        self.network = network
+        self.parent = parent
+        self.children = []
+        self.tokens: Dict[Token, None] = {}
+        if parent is not None:
+            parent.children.append(self)
+
+    def emit(self, token, wme, bindings):
+        new = Token(token, self, wme, bindings)
+        self.tokens[new] = None
+        if wme is not None:
+            self.network.wme_tokens[wme].add(new)
+        for child in self.children:
+            child.left_activate(new)
+        return new
+
+    def left_activate(self, token):
+        raise NotImplementedError
+
+    def left_retract(self, token):
+        pass
+
+
+class JoinNode(BetaNode):
+    def __init__(self, network, parent, alpha, pattern):
+        super().__init__(network, parent)
+        self.alpha = alpha
+        self.pattern = pattern
+        alpha.successors.insert(0, self)
+
+    def left_activate(self, token):
+        self.network.work += len(self.alpha.wmes)
+        for wme in list(self.alpha.wmes):
+            if (bindings := join(token.bindings, self.pattern, wme)) is not None:
+                self.emit(token, wme, bindings)
+
+    def right_activate(self, wme):
+        self.network.work += len(self.parent.tokens)
+        for token in list(self.parent.tokens):
+            if (bindings := join(token.bindings, self.pattern, wme)) is not None:
+                self.emit(token, wme, bindings)
+
+    def right_retract(self, wme):
+        pass
+
+
+class NegativeNode(BetaNode):
+    """
+    Passes a parent token on only while no wme matches the negated pattern.
+    Variables of the pattern not bound by the token are existential.
+    """
+    def __init__(self, network, parent, alpha, pattern):
+        super().__init__(network, parent)
+        self.alpha = alpha
+        self.pattern = pattern
+        self.blockers: Dict[Token, int] = {}
+        self.outputs: Dict[Token, Token] = {}
+        alpha.successors.insert(0, self)
+
+    def left_activate(self, token):
+        self.network.work += len(self.alpha.wmes)
+        count = sum(1 for wme in self.alpha.wmes
+                    if join(token.bindings, self.pattern, wme) is not None)
+        self.blockers[token] = count
+        if not count:
+            self.outputs[token] = self.emit(token, None, token.bindings)
+
+    def left_retract(self, token):
+        self.blockers.pop(token, None)
+        self.outputs.pop(token, None)
+
+    def right_activate(self, wme):
+        self.network.work += len(self.blockers)
+        for token in list(self.blockers):
+            if join(token.bindings, self.pattern, wme) is not None:
+                self.blockers[token] += 1
+                if self.blockers[token] == 1:
+                    self.network.remove_token(self.outputs.pop(token))
+
+    def right_retract(self, wme):
+        self.network.work += len(self.blockers)
+        for token in list(self.blockers):
+            if join(token.bindings, self.pattern, wme) is not None:
+                self.blockers[token] -= 1
+                if not self.blockers[token]:
+                    self.outputs[token] = self.emit(token, None, token.bindings)
+
+
+class FilterNode(BetaNode):
+    """
+    Passes a parent token on if the function applied to its bindings is True.
+    """
+    def __init__(self, network, parent, function, args):
+        super().__init__(network, parent)
+        self.function = function
+        self.args = args
+
+    def left_activate(self, token):
+        if self.function(*[token.bindings[arg] for arg in self.args]) is True:
+            self.emit(token, None, token.bindings)
+
+
+class ParameterNode(BetaNode):
+    """
+    Binds the head variables of its productions: it holds a token for each
+    task argument tuple they have been asked about, so the joins below it
+    only run for the arguments requested rather than every possible one.
+    """
+    def __init__(self, network, parent, params):
+        super().__init__(network, parent)
+        self.params = params
+        self.requested: Dict[Tuple, Token] = {}
+
+    def left_activate(self, token):
+        pass
+
+    def request(self, values: Tuple) -> Token:
+        if values not in self.requested:
+            self.requested[values] = self.emit(self.network.token, None, dict(zip(self.params, values)))
+        return self.requested[values]
+
+
+class Production:
+    """
+    A compiled precondition disjunct: a chain of beta nodes for each group of
+    connected patterns, the tests that span groups, and the renaming from
+    canonical to original variables. Its activations are the combinations
+    of the chains' tokens below the start token that pass those tests.
+    """
+    def __init__(self, start, chains, tests, renaming):
+        self.start = start
+        self.chains = chains
+        self.tests = tests
+        self.renaming = renaming
+        self.params = start.params if isinstance(start, ParameterNode) else ()
+
+    def tokens(self, token: Token, chain: List[BetaNode]) -> List[Token]:
+        """
+        Returns the tokens at the end of chain derived from token, following
+        the token tree when the chain starts from a request.
+        """
+        if not chain:
+            return [token]
+        if not self.params:
+            return list(chain[-1].tokens)
+        level = [token]
+        for node in chain:
+            level = [child for t in level for child in t.children if child.node is node]
+        return level
+
+    def activations(self, token: Token, pacer: Pacer = None) -> Iterator[Dict]:
+        groups = [self.tokens(token, chain) for chain in self.chains]
+        for bindings in self.combine(token.bindings, groups, self.tests, pacer):
+            if bindings is PAUSE:
+                yield PAUSE
+            else:
+                yield {self.renaming[var]: value for var, value in bindings.items()}
+
+    def combine(self, bindings, groups, tests, pacer):
+        tests = self.test(bindings, tests)
+        if tests is None:
+            return
+        if not groups:
+            yield bindings
+            return
+        for token in groups[0]:
+            if pacer is not None and pacer.tick():
+                yield PAUSE
+                pacer.reset()
+            yield from self.combine({**bindings, **token.bindings}, groups[1:], tests, pacer)
+
+    def test(self, bindings, tests) -> Optional[Tuple]:
+        """
+        Runs the tests whose variables are bound and returns the rest, or None
+        if one of them fails.
+        """
+        remaining = []
+        for t, requires, alpha in tests:
+            if not requires <= bindings.keys():
+                remaining.append((t, requires, alpha))
+            elif alpha is not None:
+                if any(join(bindings, t, wme) is not None for wme in alpha.wmes):
+                    return None
+            elif t[0](*[bindings[arg] for arg in t[1:]]) is not True:
+                return None
+        return tuple(remaining)
+
+
+class Rete:
+    """
+    Rete network over the compiled preconditions of every Method and Operator
+    of a domain.
+
+    Each precondition disjunct becomes a production. Patterns are ordered so
+    every join is connected, with negations and filters placed as soon as
+    their variables are bound, and variables are renamed in order of first
+    appearance so productions with the same structure share alpha memories
+    and beta nodes. The network listens to a WorkingMemory, so activations
+    are kept up to date as facts are added or removed and checking whether a
+    disjunct applies is a lookup of its activations rather than a join.
+
+    Variables of the task head are parameters: the joins of a disjunct that
+    mentions them start from a `ParameterNode` token holding the arguments
+    of a task it was asked about, so the network only keeps the activations
+    of tasks the planner has looked at (until it is discarded), and finding
+    those of a task follows its token instead of scanning every activation.
+    Patterns that share no variable are not joined into a cross product:
+    each connected group gets its own chain and their tokens are combined
+    when the disjunct is matched, with the tests that span groups.
+    parameterized=False leaves disjuncts that mention head variables to
+    `pattern_match`, and `supports` reports the disjuncts that are not
+    compiled (patterns the network cannot represent, or filters over
+    variables no pattern binds).
+
+    Changes to the working memory are queued rather than propagated as they
+    happen. `settle` propagates them, pausing when its pacer is due (the
+    joins count their candidates as work), and `matches` settles whatever
+    is still queued first, so activations are always up to date when read.
+    """
+    def __init__(self, D: Dict, wm=None, parameterized: bool = True):
+        self.alpha_index: Dict[Tuple, List[AlphaMemory]] = {}
+        self.alphas: Dict[Tuple, AlphaMemory] = {}
+        self.nodes: Dict[Tuple, BetaNode] = {}
+        self.productions: Dict[Tuple, Production] = {}
+        self.wme_tokens: Dict[Tuple, Set[Token]] = {}
+        self.queue: deque = deque()
+        self.work = 0
+        self.root = BetaNode(self, None)
+        self.token = Token(None, self.root, None, {})
+        self.root.tokens[self.token] = None
+
+        for actions in D.values():
+            for action in actions:
+                head_vars = set(f'?{a.name}' for a in action.head if isinstance(a, V))
+                for i, ptcondition in enumerate(action.ptconditions):
+                    params = head_vars & set().union(*map(term_vars, ptcondition))
+                    if params and not parameterized:
+                        continue
+                    if (production := self.compile(ptcondition, params)) is not None:
+                        self.productions[(action, i)] = production
+        if wm is not None:
+            self.attach(wm)
+
+    def attach(self, wm) -> None:
+        """
+        Loads the triples of a WorkingMemory and follows its changes.
+        """
+        wm.listeners.append(self)
+        for wme in wm:
+            self.add_wme(wme)
+
+    def supports(self, action, i: int, substitutions: Dict) -> bool:
+        return ((action, i) in self.productions and
+                not any(contains_variable(v) for v in substitutions.values()) and
+                all(self.productions[(action, i)].renaming[p] in substitutions
+                    for p in self.productions[(action, i)].params))
+
+    def matches(self, action, i: int, substitutions: Dict, pacer: Pacer = None) -> Iterator[Dict]:
+        """
+        Yields the activations of the i-th disjunct of action that agree with
+        substitutions (e.g., from unifying the task with the head). With a
+        pacer, every activation looked at is counted and PAUSE is yielded in
+        between when the pacer is due.
+        """
+        if self.queue:
+            self.flush()
+        production = self.productions[(action, i)]
+        token = self.token
+        if production.params:
+            self.work = 0
+            token = production.start.request(tuple(substitutions[production.renaming[p]]
+                                                   for p in production.params))
+            if pacer is not None and pacer.tick(self.work):
+                yield PAUSE
+                pacer.reset()
+        for theta in production.activations(token, pacer):
+            if theta is PAUSE:
+                yield PAUSE
+            elif all(theta.get(var, value) == value for var, value in substitutions.items()):
+                yield {**substitutions, **theta}
+
+    def order(self, ptcondition, params) -> Optional[Tuple[List, List]]:
+        """
+        Splits a disjunct into groups of connected patterns, given the bound
+        parameters, each followed by the tests its variables bind, and the
+        tests that span groups.
+        """
+        positives = [t for t in ptcondition if not is_negated_term(t) and not is_functional_term(t)]
+        pending = [t for t in ptcondition if is_negated_term(t) or is_functional_term(t)]
+        if any(len(t) != 3 or any(isinstance(e, tuple) and contains_variable(e) for e in t)
+               for t in positives + [t[1] for t in pending if is_negated_term(t)]):
+            return None
+
+        determined = set(params).union(*[term_vars(t) for t in positives])
+        required = {}
+        for t in pending:
+            if is_negated_term(t):
+                required[t] = term_vars(t) & determined
+            else:
+                if not term_vars(t) <= determined:
+                    return None
+                required[t] = term_vars(t)
+
+        def structure(t):
+            return (-sum(not is_variable(e) for e in t),
+                    tuple('?' if is_variable(e) else repr(e) for e in t))
+
+        groups = []
+        remaining = sorted(positives, key=structure)
+        while remaining or not groups:
+            sequence, bound, joined = [], set(params), False
+            while True:
+                for t in [t for t in pending if required[t] <= bound]:
+                    sequence.append(t)
+                    pending.remove(t)
+                connected = [t for t in remaining if term_vars(t) & bound]
+                if not connected and (joined or not remaining):
+                    break
+                t = (connected or remaining)[0]
+                remaining.remove(t)
+                sequence.append(t)
+                bound |= term_vars(t)
+                joined = True
+            groups.append(sequence)
+        return groups, pending
+
+    def compile(self, ptcondition, params) -> Optional[Production]:
+        ordered = self.order(ptcondition, params)
+        if ordered is None:
+            return None
+        groups, spanning = ordered
+
+        canonical = {}
+        def rename(e):
+            if not is_variable(e):
+                return e
+            if e not in canonical:
+                canonical[e] = f'?{len(canonical)}'
+            return canonical[e]
+
+        start = self.root
+        if params:
+            names = tuple(rename(v) for v in sorted(params))
+            key = (self.root, 'params', names)
+            if key not in self.nodes:
+                self.nodes[key] = ParameterNode(self, self.root, names)
+            start = self.nodes[key]
+
+        chains = []
+        for sequence in groups:
+            node, chain = start, []
+            for t in sequence:
+                if is_functional_term(t):
+                    args = tuple(rename(e) for e in t[1:])
+                    key = (node, 'filter', t[0], args)
+                    if key not in self.nodes:
+                        self.nodes[key] = FilterNode(self, node, t[0], args)
+                        self.seed(self.nodes[key])
+                else:
+                    kind, triple = ('not', t[1]) if is_negated_term(t) else ('join', t)
+                    pattern = tuple(rename(e) for e in triple)
+                    key = (node, kind, pattern)
+                    if key not in self.nodes:
+                        alpha = self.alpha_memory(pattern)
+                        cls = NegativeNode if kind == 'not' else JoinNode
+                        self.nodes[key] = cls(self, node, alpha, pattern)
+                        self.seed(self.nodes[key])
+                node = self.nodes[key]
+                chain.append(node)
+            chains.append(chain)
+
+        tests = []
+        for t in spanning:
+            if is_functional_term(t):
+                args = tuple(rename(e) for e in t[1:])
+                tests.append(((t[0],) + args, frozenset(args), None))
+            else:
+                pattern = tuple(rename(e) for e in t[1])
+                determined = set().union(*[term_vars(u) for group in groups for u in group])
+                tests.append((pattern, frozenset(rename(v) for v in term_vars(t) & determined),
+                              self.alpha_memory(pattern)))
+        return Production(start, chains, tuple(tests), {v: k for k, v in canonical.items()})
+
+    def seed(self, node: BetaNode) -> None:
+        """
+        Brings a new node up to date with the tokens of its parent.
+        """
+        for token in list(node.parent.tokens):
+            node.left_activate(token)
+
+    def alpha_memory(self, pattern: Tuple) -> AlphaMemory:
+        masked = tuple('?' if is_variable(e) else e for e in pattern)
+        equalities = tuple((pattern.index(e), p) for p, e in enumerate(pattern)
+                           if is_variable(e) and pattern.index(e) != p)
+        if (masked, equalities) not in self.alphas:
+            alpha = AlphaMemory(masked, equalities)
+            self.alphas[(masked, equalities)] = alpha
+            self.alpha_index.setdefault(masked, []).append(alpha)
+        return self.alphas[(masked, equalities)]
+
+    def wme_alphas(self, wme: Tuple) -> Iterator[AlphaMemory]:
+        for mask in product((False, True), repeat=3):
+            masked = tuple('?' if m else e for m, e in zip(mask, wme))
+            for alpha in self.alpha_index.get(masked, ()):
+                if alpha.test(wme):
+                    yield alpha
+
+    def add_wme(self, wme: Tuple) -> None:
+        self.queue.append((self.insert, wme))
+
+    def remove_wme(self, wme: Tuple) -> None:
+        self.queue.append((self.retract, wme))
+
+    def settle(self, pacer: Pacer = None):
+        """
+        Propagates the queued working memory changes through the network,
+        yielding PAUSE between them whenever the pacer is due.
+        """
+        while self.queue:
+            self.work = 0
+            change, wme = self.queue.popleft()
+            change(wme)
+            if pacer is not None and pacer.tick(self.work + 1):
+                yield PAUSE
+                pacer.reset()
+
+    def flush(self) -> None:
+        for _ in self.settle():
+            pass
+
+    def insert(self, wme: Tuple) -> None:
+        """
+        Adds a wme to its alpha memories one at a time, right-activating the
+        successors of each before moving on, so a wme matched by two patterns
+        of a production joins with itself once: the later join finds it
+        through the earlier one's token, not through both memories.
+        """
+        self.wme_tokens[wme] = set()
+        for alpha in list(self.wme_alphas(wme)):
+            alpha.wmes[wme] = None
+            for node in list(alpha.successors):
+                node.right_activate(wme)
+
+    def retract(self, wme: Tuple) -> None:
+        for token in list(self.wme_tokens.pop(wme, ())):
+            if token.node is not None:
+                self.remove_token(token)
+        alphas = [alpha for alpha in self.wme_alphas(wme) if wme in alpha.wmes]
+        for alpha in alphas:
+            alpha.wmes.pop(wme, None)
+        for alpha in alphas:
+            for node in list(alpha.successors):
+                node.right_retract(wme)
+
+    def remove_token(self, token: Token) -> None:
+        """
+        Removes a token and everything derived from it.
+        """
+        while token.children:
+            self.remove_token(next(iter(token.children)))
+        token.node.tokens.pop(token, None)
+        for child in token.node.children:
+            child.left_retract(token)
+        if token.parent is not None:
+            token.parent.children.pop(token, None)
+        if token.wme is not None and token.wme in self.wme_tokens:
+            self.wme_tokens[token.wme].discard(token)
+        token.node = None
@@ -0,0 +1,245 @@
+from dataclasses import dataclass, field
+from heapq import heappush, heappop
+from itertools import count
+from math import inf
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+from shop2.domain import Method, Operator, CompiledDomain, Task
+from shop2.network import TaskNetwork
+from shop2.rete import Rete
+from shop2.state import WorkingMemory
+from shop2.stats import PlannerStats
+from shop2.utils import VisitedSet
+
+if TYPE_CHECKING:
+    from shop2.planner import Budget
+
+STRATEGIES = ('ucs', 'astar', 'bnb')
+
+
+@dataclass
+class SearchNode:
+    """
+    A partial plan in the closed-world search: the state it leads to, the
+    tasks that remain, and the cost g of the methods and operators applied
+    so far, with the operators, grounded actions and substitutions of the
+    plan. decomposed maps each decomposed node of the network on this
+    branch to its task, state fingerprint and plan key at the time, and
+    sleeping holds the compound tasks that a sibling branch already
+    decomposed in the same state.
+    """
+    state: object
+    tasks: TaskNetwork
+    g: float = 0
+    plan: Tuple = ()
+    actions: Tuple = ()
+    key: int = 0
+    decomposed: Dict[int, Tuple] = field(default_factory=dict)
+    sleeping: frozenset = frozenset()
+    bindings: Tuple = ()
+
+
+@dataclass
+class SearchResult:
+    plan: List
+    actions: List[Tuple]
+    state: object
+    cost: float
+    expanded: int = 0
+    bindings: List[Dict] = field(default_factory=list)
+
+
+class MinCostHeuristic:
+    """
+    Admissible heuristic over the remaining task network: the sum, over the
+    open tasks, of the cheapest way to accomplish each one while ignoring
+    preconditions. The cheapest cost of every task in the domain is computed
+    once, as a fixed point of cost(operator) and cost(method) plus the
+    cheapest costs of its subtasks. Assumes non-negative costs.
+    """
+    def __init__(self, D: Union[Dict, CompiledDomain]):
+        self.domain = D if isinstance(D, CompiledDomain) else CompiledDomain(D)
+        self.costs = [inf] * len(self.domain.alternatives)
+        changed = True
+        while changed:
+            changed = False
+            for tid, actions in enumerate(self.domain.alternatives):
+                best = min((self.action_cost(action) for action in actions), default=inf)
+                if best < self.costs[tid]:
+                    self.costs[tid], changed = best, True
+
+    def action_cost(self, action: Union[Method, Operator]) -> float:
+        if isinstance(action, Operator):
+            return action.cost
+        return action.cost + sum(self.task_cost(task) for task in leaves(action.subtasks))
+
+    def task_cost(self, task: Task) -> float:
+        try:
+            return self.costs[self.domain.id(task)]
+        except KeyError:
+            return inf
+
+    def __call__(self, tasks: TaskNetwork, state=None) -> float:
+        return sum(self.task_cost(task) for task in tasks.tasks.values())
+
+
+def leaves(tasks):
+    if isinstance(tasks, Task):
+        yield tasks
+    else:
+        for task in tasks:
+            yield from leaves(task)
+
+
+def search(state, T: Union[List, Tuple, TaskNetwork], D: Union[Dict, CompiledDomain],
+           strategy: str = 'astar', heuristic: Optional[Callable] = None,
+           bound: float = inf, budget: 'Budget' = None, max_depth: int = None,
+           rete: bool = False, stats: PlannerStats = None) -> Optional[SearchResult]:
+    """
+    Cost-aware search for a plan of tasks T in domain D, in a closed world
+    (operator effects are applied by the planner).
+
+    Every decomposition and every operator application adds the cost of the
+    method or operator to g. Strategies:
+
+    - 'ucs': uniform-cost search, expanding the node with the lowest g.
+    - 'astar': A*, expanding the node with the lowest g + h, where h is
+      heuristic(tasks, state) (MinCostHeuristic by default).
+    - 'bnb': depth-first branch-and-bound, which keeps the cheapest plan found
+      so far and prunes every node whose g + h cannot beat it.
+
+    Nodes whose g + h exceeds bound are pruned under every strategy. Each
+    node branches over every task that can come first, and over every
+    method binding and operator binding for it. A task is not decomposed
+    again beneath a decomposition of the same task in the same state and
+    plan, which would loop; this is checked along the node's own branch, so
+    what other branches tried does not prune it. Since decomposing a task
+    does not change the state, decompositions of different tasks commute:
+    a branch does not decompose a task that an earlier sibling branch
+    decomposed in the same state (a sleep set), so each order of them is
+    only searched once. Returns the cheapest plan found, or None.
+
+    budget optionally bounds the expansions and wall-clock time (see
+    `shop2.planner.Budget`), and max_depth the nested method decompositions.
+    When the budget runs out before a plan is found, or no plan is found
+    within max_depth because of it, BudgetExceededException reports the
+    longest partial plan reached; branch-and-bound returns the cheapest plan
+    found so far instead, if any. With rete=True, preconditions are matched
+    by a Rete network over the working memory (see `planner`). stats
+    optionally counts the nodes expanded and the matching done.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown search strategy {strategy!r}, expected one of {STRATEGIES}")
+    D = D if isinstance(D, CompiledDomain) else CompiledDomain(D)
+    if heuristic is None:
+        heuristic = MinCostHeuristic(D) if strategy != 'ucs' else (lambda tasks, state: 0)
+    tasks = T.copy() if isinstance(T, TaskNetwork) else TaskNetwork(T)
+
+    wm = WorkingMemory(state, stats)
+    network = Rete(D, wm) if rete else None
+    tiebreak = count()
+    best, expanded, cutoff = None, 0, False
+    root = longest = SearchNode(state, tasks)
+    frontier = [(heuristic(tasks, state), next(tiebreak), root)]
+    while frontier:
+        if budget is not None and (reason := budget.step()) is not None:
+            if best is not None:
+                break
+            raise budget.exceeded(reason, list(longest.plan), list(longest.actions))
+        if strategy == 'bnb':
+            f, _, node = frontier.pop()
+        else:
+            f, _, node = heappop(frontier)
+        if f > bound or (best is not None and f >= best.cost):
+            continue
+        if not node.tasks:
+            best = SearchResult(list(node.plan), list(node.actions), node.state, node.g, expanded,
+                                list(node.bindings))
+            if strategy != 'bnb':
+                break
+            continue
+
+        expanded += 1
+        if stats is not None:
+            stats.count('nodes')
+        if budget is not None:
+            budget.stats['depth'] = max(budget.stats['depth'], *node.tasks.depth.values())
+        if len(node.plan) > len(longest.plan):
+            longest = node
+        if max_depth is not None and deep(node, D, max_depth):
+            cutoff = True
+        children = []
+        for child in successors(node, D, wm, network, max_depth):
+            f = child.g + heuristic(child.tasks, child.state)
+            if f <= bound and (best is None or f < best.cost):
+                children.append((f, next(tiebreak), child))
+        if strategy == 'bnb':
+            frontier.extend(sorted(children, key=lambda c: (-c[0], -c[1])))
+        else:
+            for child in children:
+                heappush(frontier, child)
+
+    if best is not None:
+        best.expanded = expanded
+    elif cutoff and budget is not None:
+        raise budget.exceeded('depth', list(longest.plan), list(longest.actions))
+    return best
+
+
+def successors(node: SearchNode, D: CompiledDomain, wm: WorkingMemory, network: Rete = None,
+               max_depth: int = None):
+    """
+    Yields the children of a search node from decomposing or applying each
+    task of its frontier, without decomposing tasks at max_depth.
+    """
+    wm.update(node.state)
+    fingerprint = wm.fingerprint.value
+    sleeping = node.sleeping
+    for nid in list(node.tasks.ready):
+        task = node.tasks[nid]
+        if nid in sleeping or loops(node, nid, (task, fingerprint, node.key)):
+            continue
+        actions = D.alternatives[D.id(task)]
+        for action in actions:
+            if isinstance(action, Operator):
+                for theta in list(action.alternatives(task, wm, network)):
+                    tasks = node.tasks.copy()
+                    tasks.remove(nid)
+                    yield SearchNode(action.apply(node.state, theta), tasks, node.g + action.cost,
+                                     node.plan + (action,), node.actions + (action.ground(theta),),
+                                     hash((node.key, action.name)), node.decomposed,
+                                     bindings=node.bindings + (theta,))
+            elif isinstance(action, Method) and (max_depth is None or
+                                                 node.tasks.depth[nid] < max_depth):
+                decomposed = {**node.decomposed, nid: (task, fingerprint, node.key)}
+                alternatives = action.alternatives(task, wm, node.key, VisitedSet(), network, 'first')
+                for subtasks in alternatives:
+                    tasks = node.tasks.copy()
+                    tasks.splice(nid, subtasks)
+                    yield SearchNode(node.state, tasks, node.g + action.cost,
+                                     node.plan, node.actions, node.key, decomposed, sleeping,
+                                     node.bindings)
+        if all(isinstance(action, Method) for action in actions):
+            sleeping = sleeping | {nid}
+
+
+def deep(node: SearchNode, D: CompiledDomain, max_depth: int) -> bool:
+    """
+    Checks whether a task of the node's frontier has methods but is at
+    max_depth, so the search is cut off there.
+    """
+    return any(node.tasks.depth[nid] >= max_depth and
+               any(isinstance(action, Method) for action in D.alternatives[D.id(node.tasks[nid])])
+               for nid in node.tasks.ready)
+
+
+def loops(node: SearchNode, nid: int, mark: Tuple) -> bool:
+    """
+    Checks whether a node of the network descends from a decomposition of
+    the same task in the same state and plan.
+    """
+    parent = node.tasks.parent[nid]
+    while parent is not None:
+        if node.decomposed.get(parent) == mark:
+            return True
+        parent = node.tasks.parent[parent]
+    return False
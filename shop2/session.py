@@ -0,0 +1,65 @@
+import asyncio
+from typing import Dict, List, Optional, Tuple, Union
+from shop2.planner import planner, PAUSE, StopException
+
+
+class PlanningSession:
+    """
+    Asyncio driver for a planner coroutine.
+
+    `await session.next_action(success, state)` plays the role of
+    `plan.send((success, state))`: it reports the outcome of the previous
+    action and returns the next one, or None once all tasks are done (the
+    StopException is then kept in `result`). The planner pauses about every
+    `pause` seconds, even in the middle of a long precondition match, and
+    the session yields to the event loop at each pause, so many sessions can
+    share one loop without a long decomposition stalling the others.
+
+    Cancelling a task that awaits the session closes the planner, as does
+    `close()` or leaving an `async with` block.
+    """
+    def __init__(self, state, T: Union[List, Tuple], D: Dict, pause: float = 0.005, **kwargs):
+        self.generator = planner(state, T, D, pause=pause, **kwargs)
+        self.started = False
+        self.result: Optional[StopException] = None
+
+    async def next_action(self, success: bool = True, state=None) -> Optional[Tuple]:
+        """
+        Returns the next action (name, args), or None once all tasks are done.
+        The arguments are ignored on the first call. Raises
+        FailedPlanException if there is no plan.
+        """
+        if self.result is not None:
+            return None
+        message = (success, state) if self.started else None
+        self.started = True
+        try:
+            action = self.generator.send(message)
+            while action is PAUSE:
+                await asyncio.sleep(0)
+                action = self.generator.send(None)
+        except StopException as e:
+            self.result = e
+            return None
+        except asyncio.CancelledError:
+            self.close()
+            raise
+        return action
+
+    async def run(self) -> List[Tuple]:
+        """
+        Plans to completion in a closed world (the planner must have been
+        created with simulate=True) and returns the grounded actions.
+        """
+        while await self.next_action() is not None:
+            pass
+        return self.result.actions
+
+    def close(self) -> None:
+        self.generator.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
@@ -0,0 +1,212 @@
+from typing import Dict, Hashable, Iterator, List, Tuple, Union
+from py_plan.pattern_matching import index_key, get_variablized_keys
+from shop2.fact import Fact
+from shop2.common import V
+
+MASK = (1 << 64) - 1
+
+
+def iter_facts(state: Union[Fact, List, Tuple]) -> Iterator[Fact]:
+    """
+    Yields the facts of a state, which may be a single fact or an (arbitrarily
+    nested) AND/list/tuple of facts.
+    """
+    if isinstance(state, Fact):
+        yield state
+    elif isinstance(state, (list, tuple)):
+        for s in state:
+            yield from iter_facts(s)
+
+
+def fact_triples(fact: Fact) -> Iterator[Tuple]:
+    """
+    Yields the (attribute, identifier, value) triples of a state fact, in the
+    same form as `fact2tuple(state, variables=False)`.
+    """
+    for cond in fact.conds:
+        value = f'?{cond.value.name}' if isinstance(cond.value, V) else cond.value
+        yield (cond.attribute, cond.identifier.name, value)
+
+
+def fact_hash(fact: Fact) -> int:
+    """
+    64-bit hash of the contents of a fact, independent of its identifier.
+    """
+    return hash(frozenset(fact.items())) & MASK
+
+
+class StateFingerprint:
+    """
+    Canonical, incrementally maintained fingerprint of a state.
+
+    The fingerprint combines per-fact content hashes Zobrist-style, so it does
+    not depend on the order of the facts and only the facts that changed
+    between two states need to be hashed. Hashes are combined by addition
+    modulo 2**64 rather than XOR so that duplicate facts do not cancel out.
+    Facts are tracked by identity; they are treated as immutable values.
+    """
+    def __init__(self, state=None):
+        self.facts: Dict[int, Tuple[Fact, int]] = {}
+        self.value = 0
+        if state is not None:
+            self.update(state)
+
+    def __hash__(self):
+        return self.value
+
+    def __eq__(self, other):
+        return isinstance(other, StateFingerprint) and self.value == other.value
+
+    def add(self, fact: Fact) -> None:
+        h = fact_hash(fact)
+        self.facts[id(fact)] = (fact, h)
+        self.value = (self.value + h) & MASK
+
+    def remove(self, fact: Fact) -> None:
+        _, h = self.facts.pop(id(fact))
+        self.value = (self.value - h) & MASK
+
+    def update(self, state) -> Tuple[List[Fact], List[Fact]]:
+        """
+        Moves the fingerprint to a new state and returns the (added, removed)
+        facts. Finding them takes a pass over the identities of the facts of
+        both states, O(|state|), but only the changed facts are hashed.
+        """
+        current = {id(fact): fact for fact in iter_facts(state)}
+        added = [fact for key, fact in current.items() if key not in self.facts]
+        removed = [fact for key, (fact, _) in self.facts.items() if key not in current]
+        for fact in removed:
+            self.remove(fact)
+        for fact in added:
+            self.add(fact)
+        return added, removed
+
+
+class WorkingMemory:
+    """
+    Persistent triple index over a state, shared by all matching against the
+    same state version.
+
+    The index has the same keys as `py_plan.pattern_matching.build_index`, but
+    each bucket is a dict used as an insertion-ordered set, so facts can be
+    added and removed and joins enumerate candidates in an order that does
+    not depend on string hashing (PYTHONHASHSEED). Moving to a new state only
+    re-indexes the facts that changed, and `version` is bumped whenever the
+    contents change. Facts are also kept by identifier, so `matching` finds
+    the facts a delete effect removes through the index. Listeners (e.g., a Rete network) are notified through
+    `add_wme`/`remove_wme` when a triple enters or leaves the memory. stats
+    optionally counts and times the matching done against the memory (see
+    `shop2.stats.PlannerStats`).
+    """
+    def __init__(self, state=None, stats=None):
+        self.state = None
+        self.stats = stats
+        self.version = 0
+        self.fingerprint = StateFingerprint()
+        self.index: Dict = {}
+        self.facts: Dict[int, Tuple[Tuple, ...]] = {}
+        self.named: Dict[str, Dict[int, Fact]] = {}
+        self.counts: Dict[Tuple, int] = {}
+        self.listeners: List = []
+        if state is not None:
+            self.update(state)
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def __iter__(self) -> Iterator[Tuple]:
+        return iter(self.counts)
+
+    def __contains__(self, triple: Tuple) -> bool:
+        return triple in self.counts
+
+    def add_triple(self, triple: Tuple) -> None:
+        if triple in self.counts:
+            self.counts[triple] += 1
+            return
+        self.counts[triple] = 1
+        for key in get_variablized_keys(index_key(triple)):
+            if key not in self.index:
+                self.index[key] = {}
+            self.index[key][triple] = None
+        for listener in self.listeners:
+            listener.add_wme(triple)
+
+    def remove_triple(self, triple: Tuple) -> None:
+        self.counts[triple] -= 1
+        if self.counts[triple]:
+            return
+        del self.counts[triple]
+        for key in get_variablized_keys(index_key(triple)):
+            del self.index[key][triple]
+            if not self.index[key]:
+                del self.index[key]
+        for listener in self.listeners:
+            listener.remove_wme(triple)
+
+    def add(self, fact: Fact) -> None:
+        if id(fact) in self.facts:
+            return
+        self.fingerprint.add(fact)
+        self.facts[id(fact)] = triples = tuple(fact_triples(fact))
+        if triples:
+            self.named.setdefault(triples[0][1], {})[id(fact)] = fact
+        for triple in triples:
+            self.add_triple(triple)
+        self.version += 1
+
+    def remove(self, fact: Fact) -> None:
+        self.fingerprint.remove(fact)
+        triples = self.facts.pop(id(fact))
+        if triples:
+            named = self.named[triples[0][1]]
+            del named[id(fact)]
+            if not named:
+                del self.named[triples[0][1]]
+        for triple in triples:
+            self.remove_triple(triple)
+        self.version += 1
+
+    def matching(self, effect: Fact) -> List[Fact]:
+        """
+        Returns the facts that have every attribute and value of a grounded
+        delete effect, in the order they were added. Each attribute and value
+        is looked up in the index, so this does not scan the memory.
+        """
+        names = None
+        for attribute, value in effect.items():
+            if not isinstance(value, Hashable):
+                continue
+            found = self.index.get(index_key((attribute, '?', value)), {})
+            found = {identifier: None for _, identifier, _ in found}
+            names = found if names is None else {n: None for n in names if n in found}
+            if not names:
+                return []
+        if names is None:
+            candidates = [fact for fact, _ in self.fingerprint.facts.values()]
+        else:
+            candidates = [fact for name in names for fact in self.named[name].values()]
+        return [fact for fact in candidates
+                if all(k in fact and fact[k] == v for k, v in effect.items())]
+
+    def update(self, state) -> Tuple[List[Fact], List[Fact]]:
+        """
+        Moves the working memory to a new state, applying only the delta from
+        the current one. Returns the (added, removed) facts.
+
+        States are plain values, so the delta is found by comparing the
+        identities of the new state's facts with those in memory, a pass of
+        O(|state|) dict lookups. Only the changed facts are then hashed,
+        re-indexed and passed to the listeners. A planner step already
+        builds its successor state in O(|state|) (see `Operator.apply`), so
+        this pass does not change its cost.
+        """
+        self.state = state
+        current = {id(fact): fact for fact in iter_facts(state)}
+        added = [fact for key, fact in current.items() if key not in self.facts]
+        removed = [fact for key, (fact, _) in self.fingerprint.facts.items() if key not in current]
+        for fact in removed:
+            self.remove(fact)
+        for fact in added:
+            self.add(fact)
+        return added, removed
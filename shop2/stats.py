@@ -0,0 +1,89 @@
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from time import perf_counter
+from typing import Dict, Iterator
+from shop2.common import PAUSE
+
+COUNTERS = ('nodes', 'backtracks', 'repairs', 'matches', 'bindings')
+
+
+class PlannerStats:
+    """
+    Counters and timers for a planner run, passed to `planner` as stats.
+
+    Counters: search nodes (steps of the main loop), backtracks, repairs,
+    calls to match a precondition disjunct ('matches', whichever of the Rete,
+    the compiled join or `pattern_match` answers them) and the bindings they
+    produced, and, per task key ("name/arity"), the method and operator
+    attempts and successes. Timers accumulate seconds spent updating the
+    working memory with new states ('update'), matching ('match'), undoing
+    the trail when backtracking ('backtrack') and waiting for the driver to
+    send back the outcome of an action ('driver').
+
+    The planner only touches the object when one is given, so a run without
+    stats pays nothing but a few `is None` checks. The object belongs to the
+    caller, who can read `snapshot()` between `send()` calls; it keeps
+    accumulating if it is passed to several runs.
+    """
+    def __init__(self):
+        self.counters: Counter = Counter(dict.fromkeys(COUNTERS, 0))
+        self.attempts: Counter = Counter()
+        self.successes: Counter = Counter()
+        self.timers: Dict[str, float] = defaultdict(float)
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def attempt(self, kind: str, key: str) -> None:
+        self.attempts[key, kind] += 1
+
+    def succeed(self, kind: str, key: str) -> None:
+        self.successes[key, kind] += 1
+
+    @contextmanager
+    def timer(self, name: str):
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.timers[name] += perf_counter() - start
+
+    def matched(self, bindings: Iterator[Dict]) -> Iterator[Dict]:
+        """
+        Counts a match call and wraps its bindings to count them and time
+        pulling them.
+        """
+        self.counters['matches'] += 1
+        return self._timed(iter(bindings))
+
+    def _timed(self, bindings: Iterator[Dict]) -> Iterator[Dict]:
+        while True:
+            start = perf_counter()
+            theta = next(bindings, None)
+            self.timers['match'] += perf_counter() - start
+            if theta is None:
+                return
+            if theta is not PAUSE:
+                self.counters['bindings'] += 1
+            yield theta
+
+    def snapshot(self) -> Dict:
+        """
+        Returns a copy of the statistics as plain dicts.
+        """
+        tasks = defaultdict(dict)
+        for (key, kind), n in self.attempts.items():
+            tasks[key][f'{kind}_attempts'] = n
+        for (key, kind), n in self.successes.items():
+            tasks[key][f'{kind}_successes'] = n
+        return {**self.counters, 'time': dict(self.timers), 'tasks': dict(tasks)}
+
+
+def timer(stats, name: str):
+    """
+    Returns stats.timer(name), or a no-op context without stats.
+    """
+    return UNTIMED if stats is None else stats.timer(name)
+
+
+UNTIMED = nullcontext()
@@ -0,0 +1,123 @@
+from collections import OrderedDict
+from typing import Dict, Hashable, List, Set, Tuple, Union
+from py_plan.unification import is_variable
+from py_plan.pattern_matching import is_negated_term, is_functional_term
+from shop2.common import V
+from shop2.domain import CompiledDomain, Task
+from shop2.planner import find_plan
+from shop2.state import iter_facts
+from shop2.validate import validate
+from shop2.rete import term_vars
+
+
+class PlanTemplates:
+    """
+    Cache of lifted plans, reused across problems that differ only in
+    constants no precondition tests.
+
+    The constants of the state and tasks are abstracted into parameters,
+    numbered by first occurrence so that equal constants share a parameter
+    (joins on equal values behave the same), except for the constants that
+    the domain's preconditions and heads mention and the values of
+    attributes that feed a filter. The remaining structure of the facts and tasks is the
+    signature a plan is stored under, with its arguments lifted to the same
+    parameters. A new problem with the same signature instantiates the plan
+    with its own constants, and the plan is used only if every action
+    applies in turn (see `shop2.validate`); otherwise, or on a miss, the
+    problem is planned with `find_plan` and its plan stored.
+    """
+    def __init__(self, D: Union[Dict, CompiledDomain], maxsize: int = 1024):
+        self.domain = D if isinstance(D, CompiledDomain) else CompiledDomain(D)
+        self.maxsize = maxsize
+        self.entries: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalid = 0
+        self.constants, self.attributes = tested(self.domain)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def find_plan(self, state, T: Union[List, Tuple], **kwargs) -> List[Tuple]:
+        """
+        Returns the grounded actions of a plan for tasks T in state, from a
+        template when one applies. Keyword arguments are passed to
+        `find_plan`.
+        """
+        signature, params = self.signature(state, T)
+        if signature in self.entries:
+            self.entries.move_to_end(signature)
+            actions = instantiate(self.entries[signature], params)
+            if validate(actions, state, self.domain).valid:
+                self.hits += 1
+                return actions
+            self.invalid += 1
+        else:
+            self.misses += 1
+
+        actions = find_plan(state, T, self.domain, **kwargs)
+        lifted = {value: ('$', i) for i, value in enumerate(params)}
+        self.entries[signature] = [(name, tuple(lifted.get(a, a) if isinstance(a, Hashable) else a
+                                                for a in args))
+                                   for name, args in actions]
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return actions
+
+    def signature(self, state, T) -> Tuple[Hashable, List]:
+        """
+        Returns the structural signature of a problem and the constants that
+        were abstracted from it, in parameter order.
+        """
+        params, index = [], {}
+
+        def lift(value, attribute=None):
+            if (attribute in self.attributes or not isinstance(value, (str, int, float))
+                    or is_variable(value) or value in self.constants):
+                return value
+            if value not in index:
+                index[value] = ('$', len(params))
+                params.append(value)
+            return index[value]
+
+        def lift_tasks(tasks):
+            if isinstance(tasks, Task):
+                return (tasks.name, tuple(lift(a) for a in tasks.args))
+            return (type(tasks), tuple(lift_tasks(t) for t in tasks))
+
+        facts = tuple(tuple((key, lift(value, key)) for key, value in fact.items())
+                      for fact in iter_facts(state))
+        return (facts, lift_tasks(T)), params
+
+
+def instantiate(actions: List[Tuple], params: List) -> List[Tuple]:
+    return [(name, tuple(params[a[1]] if isinstance(a, tuple) and len(a) == 2 and a[0] == '$' else a
+                         for a in args))
+            for name, args in actions]
+
+
+def tested(D: CompiledDomain) -> Tuple[Set, Set]:
+    """
+    Returns the constants that the preconditions of a domain mention as
+    values or its heads as arguments (a head constant selects the methods
+    and operators that apply to a task), and the attributes whose values
+    are passed to a filter.
+    """
+    constants, attributes = set(), set()
+    for actions in D.alternatives:
+        for action in actions:
+            constants.update(a for a in action.args if not isinstance(a, V) and isinstance(a, Hashable))
+            for query in action.queries:
+                triples = [t[1] if is_negated_term(t) else t for t in query.terms
+                           if not is_functional_term(t)]
+                filtered = set().union(*[term_vars(t) for t in query.terms if is_functional_term(t)])
+                for t in triples:
+                    if len(t) != 3:
+                        continue
+                    attribute, _, value = t
+                    if is_variable(value):
+                        if value in filtered:
+                            attributes.add(attribute)
+                    elif isinstance(value, Hashable):
+                        constants.add(value)
+    return constants, attributes
@@ -0,0 +1,92 @@
+import json
+from time import perf_counter
+from typing import Dict, List, Tuple
+from shop2.domain import Task
+
+
+class Tracer:
+    """
+    Records a span for every method expansion and operator application of a
+    planner run, passed to `planner` as tracer, and exports them as a
+    Chrome trace (JSON), which speedscope and chrome://tracing open as a
+    flamegraph of the task hierarchy.
+
+    Spans are nested under a frame per task the planner works on, inside the
+    frames of the tasks it descends from, so the time of each step adds up
+    along its branch of the decomposition. Every method or operator tried is
+    a span whose args record the outcome ('decomposed', 'applied', 'failed',
+    'inapplicable', 'exhausted', 'cutoff' or 'cached'), so failed attempts
+    are visible too; backtracking and repairs get spans of their own, and
+    the time a driver takes to report back is a 'driver' span under the
+    operator. Events are only recorded when a tracer is given.
+    """
+    def __init__(self):
+        self.origin = perf_counter()
+        self.events: List[Dict] = []
+        self.frames: List[Tuple[int, str]] = []
+        self.depth = 0
+
+    def now(self) -> float:
+        return (perf_counter() - self.origin) * 1e6
+
+    def enter(self, path: List[Tuple[int, str]]) -> None:
+        """
+        Moves the open task frames to path, a list of (node, label) from the
+        root task down, closing the frames not on it and opening the new ones.
+        Spans left open under the current frame are ended first.
+        """
+        while self.depth > len(self.frames):
+            self.end()
+        shared = 0
+        while (shared < len(self.frames) and shared < len(path)
+               and self.frames[shared] == path[shared]):
+            shared += 1
+        while len(self.frames) > shared:
+            self.end()
+            self.frames.pop()
+        for frame in path[shared:]:
+            self.begin(frame[1], node=frame[0])
+            self.frames.append(frame)
+
+    def begin(self, name: str, **args) -> None:
+        self.depth += 1
+        self.events.append({'name': name, 'ph': 'B', 'ts': self.now(), 'pid': 0, 'tid': 0,
+                            'args': args})
+
+    def end(self, **args) -> None:
+        self.depth -= 1
+        self.events.append({'ph': 'E', 'ts': self.now(), 'pid': 0, 'tid': 0, 'args': args})
+
+    def close(self) -> None:
+        """
+        Closes the open spans and task frames.
+        """
+        self.enter([])
+
+    def to_chrome(self) -> Dict:
+        self.close()
+        return {'traceEvents': self.events, 'displayTimeUnit': 'ms'}
+
+    def write(self, path: str) -> None:
+        """
+        Writes the trace to path as Chrome trace JSON.
+        """
+        with open(path, 'w') as f:
+            json.dump(self.to_chrome(), f, default=str)
+
+
+def label(task: Task) -> str:
+    return f"{task.name}({', '.join(str(a) for a in task.args)})"
+
+
+def ancestry(tasks, node: int) -> List[Tuple[int, str]]:
+    """
+    Returns the frames (node, label) of a node of a TaskNetwork and of the
+    tasks it was decomposed from, from the root task down.
+    """
+    path = [(node, label(tasks[node]))]
+    parent = tasks.parent[node]
+    while parent is not None:
+        path.append((parent, label(tasks.spliced[parent])))
+        parent = tasks.parent[parent]
+    return path[::-1]
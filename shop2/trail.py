@@ -0,0 +1,70 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Callable, Iterator, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from shop2.network import TaskNetwork
+
+
+@dataclass
+class ChoicePoint:
+    """
+    A point in the search that the planner can backtrack to. The state is kept
+    by reference and treated as an immutable value; the task network is
+    restored in place by the trail. When the choice point decomposes a task
+    (the node of the network it was taken at), it also keeps the index of the
+    method in the task's alternatives and the live iterator over that
+    method's remaining decompositions, so backtracking resumes the
+    enumeration instead of recomputing it. tried holds the method index and
+    subtasks of a decomposition taken from a cache, which the enumeration
+    skips. A choice point without a node is the choice of the next task to
+    work on, and frontier holds the ready tasks that were not tried yet.
+    """
+    tasks: Optional['TaskNetwork']
+    state: Any
+    node: Optional[int] = None
+    index: int = 0
+    alternatives: Optional[Iterator] = None
+    tried: Optional[Tuple] = None
+    mark: int = 0
+    frontier: Tuple[int, ...] = ()
+
+
+class Trail:
+    """
+    Undo trail for chronological backtracking.
+
+    Rather than snapshotting the task network, plan and state at every choice
+    point, destructive updates record how to undo themselves. Popping a choice
+    point replays the undo entries recorded after it was pushed, so pushing a
+    choice point is O(1) and backtracking is proportional to the changes made
+    since then.
+    """
+    def __init__(self):
+        self.entries: List[Tuple[Callable, Tuple]] = []
+        self.choicepoints: List[ChoicePoint] = []
+
+    def __len__(self):
+        return len(self.choicepoints)
+
+    def push(self, choicepoint: ChoicePoint) -> ChoicePoint:
+        choicepoint.mark = len(self.entries)
+        self.choicepoints.append(choicepoint)
+        return choicepoint
+
+    def record(self, undo: Callable, *args) -> None:
+        """
+        Record how to undo a destructive update. Nothing needs to be recorded
+        when there is no choice point to return to.
+        """
+        if self.choicepoints:
+            self.entries.append((undo, args))
+
+    def pop(self) -> ChoicePoint:
+        """
+        Undo every update recorded since the last choice point and return it.
+        """
+        choicepoint = self.choicepoints.pop()
+        while len(self.entries) > choicepoint.mark:
+            undo, args = self.entries.pop()
+            undo(*args)
+        return choicepoint
@@ -1,3 +1,4 @@
+from collections import OrderedDict
 from itertools import chain, permutations
 from operator import or_
 from typing import List, Tuple, Set, Dict, Union
@@ -18,15 +19,33 @@ def getT0(T: Union[List, Tuple]) -> Union[List, Tuple]:
         
 def removeTask(T: Union[List, Tuple], task: Task) -> Union[List, Tuple]:
     """
-    Remove task from the list or tuple T.
+    Remove task from the list or tuple T. Only the given instance is removed
+    (or the first equal task if it is not in T), never every equal task.
     """
-    if isinstance(T, list):
-        return [result for t in T if (result := removeTask(t, task)) != task and result]
-    elif isinstance(T, tuple):
-        return tuple(result for t in T if (result := removeTask(t, task)) != task and result)
-    else: 
+    if not any(t is task for t in iterTasks(T)):
+        task = next((t for t in iterTasks(T) if t == task), None)
+    return _removeTask(T, task, [False])
+
+def _removeTask(T, task, removed):
+    if isinstance(T, (list, tuple)):
+        return type(T)(result for t in T if (result := _removeTask(t, task, removed)) is not None
+                       and (result or not isinstance(result, (list, tuple))))
+    elif not removed[0] and T is task:
+        removed[0] = True
+        return None
+    else:
         return T
 
+def iterTasks(T: Union[List, Tuple, Task]):
+    """
+    Yields the tasks of T in order.
+    """
+    if isinstance(T, (list, tuple)):
+        for t in T:
+            yield from iterTasks(t)
+    else:
+        yield T
+
 def addTask(x: Union[List, Tuple], y: Union[List, Tuple]) -> Union[List, Tuple]:
     """
     Add task(s) x to the front of the list or tuple y.
@@ -109,3 +128,25 @@ def generatePermute(initial_list):
             for pperm in permutations(aperm):
                 final_all_permutations.append(pperm)
         return final_all_permutations
+
+class VisitedSet:
+    """
+    Hash set of visited keys with an optional size bound. Once the bound is
+    reached the oldest keys are evicted first.
+    """
+    def __init__(self, maxsize: int = None):
+        self.maxsize = maxsize
+        self.keys = OrderedDict()
+
+    def __contains__(self, key) -> bool:
+        return key in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def add(self, key) -> None:
+        if key in self.keys:
+            return
+        self.keys[key] = None
+        if self.maxsize is not None and len(self.keys) > self.maxsize:
+            self.keys.popitem(last=False)
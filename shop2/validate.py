@@ -0,0 +1,132 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+from shop2.common import V
+from shop2.conditions import AND
+from shop2.domain import CompiledDomain, Operator, Task, matches
+from shop2.state import WorkingMemory
+
+
+@dataclass
+class ValidationResult:
+    """
+    The outcome of validating a plan: whether every action applies, the
+    index and action of the first one that does not, and the state reached
+    by the actions that do apply.
+    """
+    valid: bool
+    state: object = None
+    step: Optional[int] = None
+    action: Optional[Tuple] = None
+    message: Optional[str] = None
+
+
+def validate(actions: List[Tuple], state, D: Union[Dict, CompiledDomain],
+             plan: List[Operator] = None, bindings: List[Dict] = None) -> ValidationResult:
+    """
+    Checks that the grounded actions (name, args) of a plan apply in order
+    from state in domain D, simulating the operator effects.
+
+    With the operators and substitutions the planner applied (the plan and
+    bindings of its StopException), each action is checked against exactly
+    those: the operator must be one of the task's, ground to the action and
+    have its preconditions satisfied by the substitution, whose effects are
+    then applied. Without them, each action is checked against the
+    operators for its task and the first one that applies is used (as the
+    planner does). If its effects use variables that the action leaves
+    open, every binding of its preconditions is enumerated, and the action
+    is rejected when two of them ground the effects differently, since the
+    actions do not record which one was applied.
+
+    The state is held in one WorkingMemory that is updated with each
+    operator's effects; a delete effect finds the facts it removes through
+    the memory's index (see `WorkingMemory.matching`), so each step only
+    touches the facts it adds and removes. After indexing the state once,
+    validation costs time linear in the length of the plan.
+    """
+    if (plan is None) != (bindings is None):
+        raise ValueError("Pass both the plan's operators and their bindings, or neither")
+    D = D if isinstance(D, CompiledDomain) else CompiledDomain(D)
+    wm = WorkingMemory(state)
+    for step, (name, args) in enumerate(actions):
+        task = Task(name, *args)
+        action = (name, tuple(args))
+        try:
+            operators = [a for a in D.alternatives[D.id(task)] if isinstance(a, Operator)]
+        except KeyError:
+            return invalid(wm, step, action, f"Unknown task {name}/{len(args)}")
+        if bindings is not None:
+            operator, theta = plan[step], bindings[step]
+            if operator not in operators or operator.ground(theta) != action:
+                return invalid(wm, step, action,
+                               f"The recorded operator does not ground to {name}{tuple(args)}")
+            if not holds(operator, theta, wm):
+                return invalid(wm, step, action,
+                               f"The recorded binding of {name}{tuple(args)} does not apply")
+        else:
+            for operator in operators:
+                if (theta := operator.bindings(task, wm, match='first')) is not None:
+                    break
+            else:
+                return invalid(wm, step, action, f"No operator applies to {name}{tuple(args)}")
+            if not determined(operator) and not unique(operator, task, theta, wm):
+                return invalid(wm, step, action,
+                               f"The effects of {name}{tuple(args)} depend on bindings the plan "
+                               f"does not record")
+        deleted, added = operator.grounded_effects(theta)
+        for effect in deleted:
+            for fact in wm.matching(effect):
+                wm.remove(fact)
+        for fact in added:
+            wm.add(fact)
+    return ValidationResult(True, current(wm))
+
+
+def holds(operator: Operator, theta: Dict, wm: WorkingMemory) -> bool:
+    """
+    Checks that substitution theta satisfies the preconditions of operator.
+    """
+    if not operator.preconditions:
+        return True
+    return any(next(matches(operator, i, wm, theta), None) is not None
+               for i in range(len(operator.queries)))
+
+
+def determined(operator: Operator) -> bool:
+    """
+    Checks that the effects of operator only use variables of its head, so
+    its grounded action determines them.
+    """
+    head = set(variables(operator.args))
+    return all(v in head for effect in (*operator.del_effects, *operator.add_effects)
+               for v in variables(tuple(effect.values())))
+
+
+def unique(operator: Operator, task: Task, theta: Dict, wm: WorkingMemory) -> bool:
+    """
+    Checks that every binding of operator for task grounds its effects the
+    same way as theta.
+    """
+    effects = operator.grounded_effects(theta)
+    substitutions = operator.matcher.match(task)
+    return all(operator.grounded_effects(other) == effects
+               for i in range(len(operator.queries))
+               for other in matches(operator, i, wm, substitutions))
+
+
+def variables(value):
+    """
+    Yields the names of the variables in a value, which may nest tuples.
+    """
+    if isinstance(value, V):
+        yield value.name
+    elif isinstance(value, tuple):
+        for v in value:
+            yield from variables(v)
+
+
+def current(wm: WorkingMemory):
+    return AND(*(fact for fact, _ in wm.fingerprint.facts.values()))
+
+
+def invalid(wm: WorkingMemory, step: int, action: Tuple, message: str) -> ValidationResult:
+    return ValidationResult(False, current(wm), step, action, message)
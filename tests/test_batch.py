@@ -0,0 +1,45 @@
+import pytest
+from shop2 import batch
+from shop2.batch import plan_many
+from shop2.common import V
+from shop2.conditions import AND, Filter
+from shop2.domain import Task, Operator
+from shop2.fact import Fact
+
+D = {
+    'mark/1': [Operator(head=('mark', V('o')), preconditions=Fact(item=V('o')),
+                        effects=Fact(marked=V('o')))],
+}
+STATE = AND(Fact(item='a'), Fact(item='b'))
+PROBLEMS = [
+    (STATE, [Task('mark', 'a')]),
+    (STATE, [Task('mark', 'c')]),
+    (STATE, [Task('unknown')]),
+    (STATE, [Task('mark', 'b'), Task('mark', 'a')]),
+]
+
+
+def check(results):
+    results = sorted(results, key=lambda r: r.index)
+    assert [r.index for r in results] == [0, 1, 2, 3]
+    assert results[0].actions == [('mark', ('a',))] and results[0].error is None
+    assert results[1].actions is None and 'No valid plan' in results[1].error
+    assert results[2].actions is None and results[2].error.startswith('KeyError')
+    assert results[3].actions == [('mark', ('b',)), ('mark', ('a',))]
+
+
+def test_in_process_batch_records_errors_per_problem():
+    check(plan_many(D, PROBLEMS, workers=1))
+    assert batch._domain is None
+
+
+@pytest.mark.parametrize('chunksize', [1, 3])
+def test_pooled_batch_records_errors_per_problem(chunksize):
+    check(plan_many(D, PROBLEMS, workers=2, chunksize=chunksize))
+
+
+def test_pooled_batch_with_unregistered_functions():
+    domain = {'mark/1': [Operator(head=('mark', V('o')),
+                                  preconditions=Fact(item=V('o')) & Filter(lambda o: o != 'c'),
+                                  effects=Fact(marked=V('o')))]}
+    check(plan_many(domain, PROBLEMS, workers=2))
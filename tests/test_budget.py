@@ -0,0 +1,70 @@
+import pytest
+from shop2.common import V
+from shop2.conditions import AND
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.planner import find_plan, BudgetExceededException
+from shop2.search import STRATEGIES
+from shop2.stats import PlannerStats
+
+STATE = AND(*[Fact(item=i) for i in range(3)])
+
+# count(n) decomposes n levels deep before its only operator applies.
+D = {
+    'count/1': [Method(head=('count', V('n')), preconditions=Fact(item=V('n')),
+                       subtasks=[Task('tick', V('n')), Task('rest', V('n'))])],
+    'rest/1': [Method(head=('rest', V('n')), preconditions=[], subtasks=[Task('leaf')])],
+    'tick/1': [Operator(head=('tick', V('n')), preconditions=[], effects=Fact(ticked=V('n')))],
+    'leaf/0': [Operator(head=('leaf',), preconditions=[], effects=[])],
+}
+TASKS = [Task('count', 0), Task('count', 1)]
+PLAN = [('tick', (0,)), ('leaf', ()), ('tick', (1,)), ('leaf', ())]
+
+
+@pytest.mark.parametrize('strategy', ('dfs',) + STRATEGIES)
+def test_unbounded(strategy):
+    assert find_plan(STATE, TASKS, D, strategy=strategy) == PLAN
+
+
+@pytest.mark.parametrize('strategy', ('dfs',) + STRATEGIES)
+def test_expansion_budget(strategy):
+    with pytest.raises(BudgetExceededException) as e:
+        find_plan(STATE, TASKS, D, strategy=strategy, max_expansions=3)
+    assert e.value.reason == 'expansions' and e.value.stats['expansions'] == 3
+    assert e.value.actions == PLAN[:len(e.value.actions)]
+
+
+@pytest.mark.parametrize('strategy', ('dfs',) + STRATEGIES)
+def test_time_budget(strategy):
+    with pytest.raises(BudgetExceededException) as e:
+        find_plan(STATE, TASKS, D, strategy=strategy, time_limit=-1)
+    assert e.value.reason == 'time'
+
+
+@pytest.mark.parametrize('strategy', ('dfs',) + STRATEGIES)
+def test_depth_budget(strategy):
+    with pytest.raises(BudgetExceededException) as e:
+        find_plan(STATE, TASKS, D, strategy=strategy, max_depth=1)
+    assert e.value.reason == 'depth'
+    assert find_plan(STATE, TASKS, D, strategy=strategy, max_depth=2) == PLAN
+
+
+def test_iterative_deepening():
+    assert find_plan(STATE, TASKS, D, deepening=True) == PLAN
+    with pytest.raises(BudgetExceededException) as e:
+        find_plan(STATE, TASKS, D, deepening=True, max_depth=1)
+    assert e.value.stats['iterations'] == 1
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_best_first_strategies_take_stats_and_rete(strategy):
+    stats = PlannerStats()
+    assert find_plan(STATE, TASKS, D, strategy=strategy, rete=True, stats=stats) == PLAN
+    assert stats.counters['nodes'] > 0 and stats.counters['matches'] > 0
+
+
+@pytest.mark.parametrize('option', [{'visited_limit': 10}, {'deepening': True}, {'pause': 0.1},
+                                    {'repair': True}, {'match': 'first'}])
+def test_best_first_strategies_reject_dfs_options(option):
+    with pytest.raises(ValueError):
+        find_plan(STATE, TASKS, D, strategy='astar', **option)
@@ -0,0 +1,40 @@
+import pytest
+from shop2.cache import DecompositionCache
+from shop2.common import V
+from shop2.conditions import AND
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.planner import find_plan, FailedPlanException
+from shop2.stats import PlannerStats
+
+# solve picks an item by its method; use only works on an item that is ok,
+# which the method's precondition does not look at.
+D = {
+    'solve/0': [Method(head=('solve',), preconditions=Fact(item=V('x')), subtasks=[Task('use', V('x'))])],
+    'use/1': [Operator(head=('use', V('x')), preconditions=Fact(ok=V('x')), effects=Fact(used=V('x')))],
+}
+
+
+def state(*ok):
+    return AND(Fact(item='a'), Fact(item='b'), *[Fact(ok=x) for x in ok])
+
+
+def plan(cache, *ok, stats=None):
+    return find_plan(state(*ok), [Task('solve')], D, match='first', cache=cache, stats=stats)
+
+
+def test_only_decompositions_that_worked_are_cached():
+    cache = DecompositionCache()
+    with pytest.raises(FailedPlanException):
+        plan(cache)
+    assert len(cache) == 0
+    assert plan(cache, 'b') == [('use', ('b',))]
+    assert [subtasks for _, subtasks in cache.entries.values()] == [[Task('use', 'b')]]
+
+
+def test_cached_decomposition_that_fails_backtracks_to_the_others():
+    cache = DecompositionCache()
+    assert plan(cache, 'a') == [('use', ('a',))]
+    stats = PlannerStats()
+    assert plan(cache, 'b', stats=stats) == [('use', ('b',))]
+    assert cache.hits == 1 and stats.counters['backtracks'] == 1
@@ -0,0 +1,56 @@
+from itertools import count, islice
+import pytest
+from shop2.common import V
+from shop2.conditions import AND
+from shop2.domain import CompiledDomain, Task, Method, Operator, shuffled
+from shop2.fact import Fact
+from shop2.utils import VisitedSet
+
+
+def test_shuffled_yields_each_binding_once():
+    for n in (0, 1, 5, 300):
+        assert sorted(shuffled(iter(range(n)), window=16)) == list(range(n))
+
+
+def test_shuffled_pulls_bindings_lazily():
+    source = count()
+    first = list(islice(shuffled(source, window=8), 3))
+    assert len(set(first)) == 3 and all(x < 11 for x in first)
+    assert next(source) == 11
+
+
+def test_random_alternatives_cover_every_binding():
+    method = Method(head=('pick',), preconditions=Fact(value=V('v')),
+                    subtasks=[Task('use', V('v'))])
+    state = AND(*[Fact(value=i) for i in range(20)])
+    alternatives = method.alternatives(Task('pick'), state, 0, VisitedSet(), match='random')
+    assert sorted(subtasks[0].args[0] for subtasks in alternatives) == list(range(20))
+
+
+GO = Operator(head=('go', V('to')), preconditions=[], effects=Fact(at=V('to')))
+
+
+def test_compiled_domain_dispatches_by_name_and_arity():
+    D = CompiledDomain({'go/1': [GO]})
+    assert D.alternatives[D.id(Task('go', 'park'))] == (GO,) and D['go/1'] == (GO,)
+    assert list(D) == ['go/1'] and len(D) == 1
+    with pytest.raises(KeyError, match='go/2'):
+        D.id(Task('go', 'park', 'now'))
+
+
+@pytest.mark.parametrize('key', ['go', 'go/', 'go/one', '/1x'])
+def test_compiled_domain_rejects_malformed_keys(key):
+    with pytest.raises(ValueError, match='name/arity'):
+        CompiledDomain({key: [GO]})
+
+
+@pytest.mark.parametrize('key', ['go/2', 'walk/1'])
+def test_compiled_domain_rejects_heads_that_do_not_match_the_key(key):
+    with pytest.raises(ValueError, match='does not match'):
+        CompiledDomain({key: [GO]})
+
+
+@pytest.mark.parametrize('action', [('go', V('to')), Task('go', 'park'), None])
+def test_compiled_domain_rejects_other_entries(action):
+    with pytest.raises(TypeError, match='not a Method or Operator'):
+        CompiledDomain({'go/1': [GO, action]})
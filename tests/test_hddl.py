@@ -0,0 +1,93 @@
+import json
+import os
+import pytest
+from shop2 import hddl
+from shop2.hddl import HDDLError, load, load_domain, parse, translate_domain
+from shop2.domain import Task
+from shop2.planner import find_plan
+from shop2.validate import validate
+
+DOMAIN = """
+(define (domain delivery)
+  (:requirements :hierarchy :typing)
+  (:types package location vehicle - object truck - vehicle)
+  (:task deliver :parameters (?p - package ?l - location))
+  (:method m-here
+    :parameters (?p - package ?l - location)
+    :task (deliver ?p ?l)
+    :precondition (at ?p ?l)
+    :subtasks ())
+  (:method m-drive ; load, drive and unload
+    :parameters (?p - package ?l ?from - location ?t - truck)
+    :task (deliver ?p ?l)
+    :precondition (and (at ?p ?from) (at ?t ?from) (not (= ?from ?l)))
+    :subtasks (and (t1 (unload ?t ?p ?l)) (t2 (load ?t ?p ?from)) (t3 (drive ?t ?from ?l)))
+    :ordering (and (< t2 t3) (< t3 t1)))
+  (:action load :parameters (?t - truck ?p - package ?l - location)
+    :precondition (and (at ?t ?l) (at ?p ?l))
+    :effect (and (not (at ?p ?l)) (in ?p ?t)))
+  (:action drive :parameters (?t - vehicle ?a ?b - location)
+    :precondition (at ?t ?a)
+    :effect (and (not (at ?t ?a)) (at ?t ?b)))
+  (:action unload :parameters (?t - truck ?p - package ?l - location)
+    :precondition (and (at ?t ?l) (in ?p ?t))
+    :effect (and (not (in ?p ?t)) (at ?p ?l))))
+"""
+PROBLEM = """
+(define (problem p1) (:domain delivery)
+  (:objects pkg - package home depot - location van - truck)
+  (:htn :ordered-subtasks (and (t1 (deliver pkg depot)) (t2 (deliver pkg depot))))
+  (:init (at pkg home) (at van home)))
+"""
+PLAN = [('load', ('van', 'pkg', 'home')), ('drive', ('van', 'home', 'depot')),
+        ('unload', ('van', 'pkg', 'depot'))]
+
+
+@pytest.fixture
+def files(tmp_path):
+    paths = {}
+    for name, text in (('domain', DOMAIN), ('problem', PROBLEM)):
+        paths[name] = tmp_path / f'{name}.hddl'
+        paths[name].write_text(text)
+        paths[f'{name}.json'] = tmp_path / f'{name}.json'
+        paths[f'{name}.json'].write_text(json.dumps(parse(text)))
+    return {name: str(path) for name, path in paths.items()}
+
+
+@pytest.mark.parametrize('suffix', ['', '.json'])
+def test_load_and_plan(files, suffix):
+    domain, state, tasks = load(files['domain' + suffix], files['problem' + suffix])
+    assert tasks == [Task('deliver', 'pkg', 'depot'), Task('deliver', 'pkg', 'depot')]
+    actions = find_plan(state, tasks, domain, match='first')
+    assert actions == PLAN
+    assert validate(actions, state, domain).valid
+
+
+def test_ordering_constraints_are_linearized():
+    domain, _, _ = translate_domain(parse(DOMAIN))
+    method = domain['deliver/2'][1]
+    assert [task.name for task in method.subtasks] == ['load', 'drive', 'unload']
+
+
+def test_compiled_domain_is_cached(files, tmp_path, monkeypatch):
+    cache_dir = str(tmp_path / 'cache')
+    load_domain(files['domain'], cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+
+    def translate(sexpr):
+        raise AssertionError("the cached domain was not used")
+    monkeypatch.setattr(hddl, 'translate_domain', translate)
+    domain, state, tasks = load(files['domain'], files['problem'], cache_dir)
+    assert find_plan(state, tasks, domain, match='first') == PLAN
+
+
+@pytest.mark.parametrize('text', [
+    "(define (domain d) (:action a :parameters () :effect (forall (?x) (p ?x))))",
+    "(define (domain d) (:method m :parameters () :task (t) :subtasks (and (x (a)) (y (b)))"
+    " :ordering (and (< x y) (< y x))))",
+    "(define (problem d))",
+    "(define (domain d)))",
+])
+def test_unsupported_input_raises(text):
+    with pytest.raises(HDDLError):
+        translate_domain(parse(text))
@@ -0,0 +1,51 @@
+import pytest
+from shop2.common import V
+from shop2.conditions import AND, OR, NOT, Filter
+from shop2.domain import Task, Method, Operator, Factorized, matches
+from shop2.fact import Fact
+from shop2.planner import find_plan
+from shop2.state import WorkingMemory
+
+X, Y, Z = V('x'), V('y'), V('z')
+STATE = AND(*[Fact(kind=k, val=i) for k in 'abc' for i in range(4)],
+            *[Fact(ok=i) for i in (1, 2)], Fact(link=0, to=3), Fact(link=2, to=1))
+
+PRECONDITIONS = [
+    OR(Fact(kind='a', val=X), Fact(kind='b', val=X)),
+    Fact(ok=X) & OR(Fact(kind='a', val=X), Fact(kind='c', val=X)),
+    OR(Fact(kind='a', val=X) & NOT(Fact(ok=X)), Fact(link=X, to=Y)),
+    OR(Fact(kind='a', val=X), Fact(kind='b', val=X) & OR(Fact(link=X, to=Y), Fact(ok=X)))
+    & Filter(lambda x: x < 3),
+    OR(Fact(link=X, to=Y), Fact(link=Y, to=X)) & OR(Fact(ok=Y), NOT(Fact(kind='c', val=Y)))
+    & Fact(kind='b', val=Z) & Filter(lambda x, z: x == z),
+]
+
+
+def bindings(preconditions, lazy):
+    method = Method(head=('m',), preconditions=preconditions, subtasks=[], lazy=lazy)
+    wm = WorkingMemory(STATE)
+    found = [theta for i in range(len(method.queries)) for theta in matches(method, i, wm, {})]
+    return sorted(sorted((k, v) for k, v in theta.items() if 'genvar' not in k) for theta in found)
+
+
+@pytest.mark.parametrize('preconditions', PRECONDITIONS)
+def test_lazy_and_eager_bindings_agree(preconditions):
+    eager = bindings(preconditions, lazy=False)
+    assert eager and bindings(preconditions, lazy=True) == eager
+
+
+def test_lazy_is_only_used_when_asked_for():
+    wide = AND(*[OR(Fact(kind=k, val=X), Fact(ok=X)) for k in 'abcabcab'])
+    assert not any(isinstance(q, Factorized) for q in Method(('m',), wide, []).queries)
+    assert isinstance(Method(('m',), wide, [], lazy=True).queries[0], Factorized)
+
+
+@pytest.mark.parametrize('lazy', [False, True])
+def test_later_or_branches_are_explored_on_backtracking(lazy):
+    D = {'solve/0': [Method(head=('solve',), preconditions=OR(Fact(kind='a', val=X), Fact(kind='b', val=X)),
+                            subtasks=[Task('use', X)], lazy=lazy)],
+         'use/1': [Operator(head=('use', X), preconditions=Fact(ok=X) & Fact(kind='b', val=X),
+                            effects=[])]}
+    state = AND(Fact(kind='a', val=1), Fact(kind='b', val=2), Fact(ok=1), Fact(ok=2))
+    for _ in range(5):
+        assert find_plan(state, [Task('solve')], D, match='first') == [('use', (2,))]
@@ -0,0 +1,63 @@
+import os
+import subprocess
+import sys
+from collections import Counter
+from shop2.common import V
+from shop2.conditions import AND
+from shop2.domain import Task, Operator, select
+from shop2.fact import Fact
+from shop2.planner import find_plan
+
+SCRIPT = """
+from shop2.common import V
+from shop2.conditions import AND, Filter
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.planner import find_plan
+from shop2.planner import find_plan
+D = {
+    'solve/0': [Method(head=('solve',),
+                       preconditions=(Fact(kind='n', name=V('a'), value=V('v')) &
+                                      Fact(kind='n', name=V('b'), value=V('w')) &
+                                      Filter(lambda v, w: v < w)),
+                       subtasks=[Task('use', V('a'), V('b'))])],
+    'use/2': [Operator(head=('use', V('a'), V('b')), preconditions=Fact(kind='n', name=V('c')),
+                       effects=[Fact(used=V('a')), Fact(used=V('c'))])],
+}
+state = AND(*[Fact(kind='n', name=f'n{i}', value=(i * 7) % 13) for i in range(13)])
+print(find_plan(state, [Task('solve')], D, match='first', rete=RETE))
+"""
+
+
+def test_select_first_and_random():
+    assert select(iter([{'x': 1}, {'x': 2}]), 'first') == {'x': 1}
+    assert select(iter([]), 'random') is None
+    drawn = Counter(select(iter([{'x': i} for i in range(3)]), 'random')['x'] for _ in range(3000))
+    assert set(drawn) == {0, 1, 2} and min(drawn.values()) > 800
+
+
+def test_first_operator_binding():
+    operator = Operator(head=('pick',), preconditions=Fact(value=V('v')), effects=[])
+    state = AND(*[Fact(value=i) for i in range(10)])
+    assert {operator.bindings(Task('pick'), state, match='first')['?v'] for _ in range(5)} == {0}
+
+
+def test_first_match_does_not_depend_on_the_hash_seed():
+    for rete in (False, True):
+        plans = set()
+        for seed in ('1', '2', '3'):
+            env = {**os.environ, 'PYTHONHASHSEED': seed}
+            script = SCRIPT.replace('RETE', repr(rete))
+            plans.add(subprocess.run([sys.executable, '-c', script], env=env, check=True,
+                                     capture_output=True, text=True).stdout)
+        assert len(plans) == 1
+
+
+def test_first_match_orders_unordered_tasks():
+    D = {f'{name}/0': [Operator(head=(name,), preconditions=Fact(value=V('v')), effects=Fact(done=name))]
+         for name in 'abcde'}
+    state = AND(*[Fact(value=i) for i in range(3)])
+    tasks = [(Task('a'), Task('b'), Task('c'), Task('d'), Task('e'))]
+    for rete in (False, True):
+        plans = {tuple(find_plan(state, tasks, D, match='first', rete=rete)) for _ in range(20)}
+        assert len(plans) == 1 and sorted(next(iter(plans))) == [(name, ()) for name in 'abcde']
@@ -0,0 +1,44 @@
+from shop2.conditions import AND
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.network import TaskNetwork
+from shop2.planner import find_plan
+from shop2.trail import Trail, ChoicePoint
+
+D = {
+    'pair/0': [Method(head=('pair',), preconditions=[], subtasks=[Task('a'), Task('b')])],
+    'a/0': [Operator(head=('a',), preconditions=[], effects=Fact(done='a'))],
+    'b/0': [Operator(head=('b',), preconditions=Fact(done='a'), effects=Fact(done='b'))],
+    'c/0': [Operator(head=('c',), preconditions=[], effects=Fact(done='c'))],
+}
+
+
+def test_frontier_follows_the_ordering():
+    tasks = TaskNetwork([Task('a'), (Task('b'), Task('c')), Task('d')])
+    assert tasks.frontier() == (Task('a'),)
+    tasks.remove(tasks.ready[0])
+    assert set(tasks.frontier()) == {Task('b'), Task('c')}
+    for node in list(tasks.ready):
+        tasks.remove(node)
+    assert tasks.frontier() == (Task('d'),)
+
+
+def test_splice_and_undo():
+    trail = Trail()
+    tasks = TaskNetwork([Task('pair'), Task('c')], trail)
+    node = tasks.ready[0]
+    trail.push(ChoicePoint(tasks, None, node))
+    tasks.splice(node, D['pair/0'][0].subtasks)
+    assert tasks.frontier() == (Task('a'),) and len(tasks) == 3
+    assert trail.pop().node == node
+    assert tasks.frontier() == (Task('pair'),) and len(tasks) == 2
+
+
+def test_planning_leaves_the_given_network_unchanged():
+    tasks = TaskNetwork([Task('pair'), Task('c')])
+    before = (dict(tasks.tasks), list(tasks.ready), tasks.trail)
+    for _ in range(2):
+        assert find_plan(AND(Fact(start=True)), tasks, D) == [('a', ()), ('b', ()), ('c', ())]
+        assert (dict(tasks.tasks), list(tasks.ready), tasks.trail) == before
+    assert find_plan(AND(Fact(start=True)), tasks, D, deepening=True) == [
+        ('a', ()), ('b', ()), ('c', ())]
@@ -0,0 +1,56 @@
+import random
+import pytest
+from py_plan.pattern_matching import pattern_match
+from shop2.common import V
+from shop2.conditions import AND, NOT, Filter
+from shop2.domain import Operator
+from shop2.fact import Fact
+from shop2.query import Query
+from shop2.state import WorkingMemory
+
+PRECONDITIONS = [
+    Fact(kind='n', value=V('v')),
+    Fact(kind='n', value=V('v')) & Fact(kind='m', value=V('v')),
+    Fact(kind='n', value=V('v')) & Fact(kind='m', value=V('w')) & Filter(lambda v, w: v < w),
+    Fact(kind='n', value=V('v')) & NOT(Fact(kind='m', value=V('v'))),
+    Fact(kind='n', value=V('v')) & NOT(Fact(kind='m', value=V('x'))),
+    Fact(kind=V('k'), value=V('v')) & Fact(kind='n', value=V('v')) & NOT(Fact(kind='m', value=V('v'))),
+    (Fact(kind='n', value=V('a')) & Fact(kind='m', value=V('b')) & Fact(kind='n', value=V('c')) &
+     Fact(kind='m', value=V('d')) & Filter(lambda a, b, c, d: a + b == c + d)),
+]
+
+
+def frozen(bindings):
+    return sorted(sorted(theta.items(), key=repr) for theta in bindings)
+
+
+@pytest.mark.parametrize('preconditions', PRECONDITIONS)
+def test_query_matches_like_pattern_match(preconditions):
+    ptcondition = Operator(head=('pick',), preconditions=preconditions, effects=[]).ptconditions[0]
+    query = Query(ptcondition)
+    rng = random.Random(0)
+    for _ in range(20):
+        wm = WorkingMemory(AND(*[Fact(kind=rng.choice('nm'), value=rng.randrange(4))
+                                 for _ in range(rng.randrange(8))]))
+        for substitution in ({}, {'?v': 1}):
+            assert query.supports(substitution)
+            assert (frozen(query.match(wm.index, substitution)) ==
+                    frozen(pattern_match(ptcondition, wm.index, substitution)))
+
+
+def test_filter_runs_as_soon_as_its_variables_are_bound():
+    calls = []
+
+    def never(a, b, c, d):
+        calls.append((a, b, c, d))
+        return False
+
+    preconditions = (Fact(kind='n', value=V('a')) & Fact(kind='m', value=V('b')) &
+                     Fact(kind='o', value=V('c')) & Fact(kind='p', value=V('d')) &
+                     Fact(kind='q', value=V('e')) & Filter(never))
+    ptcondition = Operator(head=('pick',), preconditions=preconditions, effects=[]).ptconditions[0]
+    wm = WorkingMemory(AND(*[Fact(kind=kind, value=i) for kind in 'nmop' for i in range(2)],
+                           *[Fact(kind='q', value=i) for i in range(30)]))
+    assert list(Query(ptcondition).match(wm.index, {})) == []
+    assert len(calls) == 2 ** 4
+    assert list(pattern_match(ptcondition, wm.index, {})) == []
@@ -0,0 +1,45 @@
+import pickle
+import pytest
+from shop2 import registry
+from shop2.common import V
+from shop2.conditions import Filter
+from shop2.domain import Task, Operator
+from shop2.fact import Fact
+from shop2.planner import find_plan
+from shop2.registry import register, dumps, loads
+
+STATE = Fact(item='a') & Fact(item='b') & Fact(item='c')
+TASKS = [Task('mark')]
+
+
+@register
+def wanted(o):
+    return o == 'b'
+
+
+def domain(test):
+    return {'mark/0': [Operator(head=('mark',), preconditions=Fact(item=V('o')) & Filter(test),
+                                effects=Fact(marked=V('o')))]}
+
+
+def test_registered_functions_round_trip():
+    test = register(lambda o: o == 'c', f'{__name__}:last')
+    for D in (domain(wanted), domain(test)):
+        restored = loads(dumps(D))
+        assert find_plan(STATE, TASKS, restored) == find_plan(STATE, TASKS, D)
+    assert loads(dumps(test)) is test
+
+
+def test_unregistered_name_is_resolved_from_its_module(monkeypatch):
+    data = dumps(domain(wanted))
+    monkeypatch.delitem(registry.REGISTRY, f'{__name__}:wanted')
+    assert find_plan(STATE, TASKS, loads(data)) == [('mark', ())]
+
+
+def test_unknown_names_and_unregistered_lambdas_fail():
+    with pytest.raises(pickle.PicklingError):
+        dumps(domain(lambda o: True))
+    data = dumps(domain(register(lambda o: True, f'{__name__}:missing')))
+    del registry.REGISTRY[f'{__name__}:missing']
+    with pytest.raises(KeyError):
+        loads(data)
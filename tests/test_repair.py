@@ -0,0 +1,55 @@
+import pytest
+from shop2.conditions import AND
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.planner import planner, FailedPlanException, StopException
+from shop2.stats import PlannerStats
+
+D = {
+    'trip/0': [Method(head=('trip',), preconditions=[], subtasks=[Task('prepare'), Task('deliver')])],
+    'prepare/0': [Method(head=('prepare',), preconditions=[], subtasks=[Task('pack'), Task('label')])],
+    'deliver/0': [Method(head=('deliver',), preconditions=Fact(road='open'),
+                         subtasks=[Task('drive', 'a'), Task('drive', 'b')]),
+                  Method(head=('deliver',), preconditions=Fact(road='closed'),
+                         subtasks=[Task('walk', 'a'), Task('walk', 'b')])],
+    'pack/0': [Operator(head=('pack',), preconditions=[], effects=Fact(packed=True))],
+    'label/0': [Operator(head=('label',), preconditions=[], effects=Fact(labelled=True))],
+    'drive/1': [Operator(head=('drive', 'a'), preconditions=Fact(road='open'), effects=Fact(at='a')),
+                Operator(head=('drive', 'b'), preconditions=Fact(road='open'), effects=Fact(at='b'))],
+    'walk/1': [Operator(head=('walk', 'a'), preconditions=[], effects=Fact(at='a')),
+               Operator(head=('walk', 'b'), preconditions=[], effects=Fact(at='b'))],
+}
+
+
+def drive(repair, success):
+    """
+    Executes the plan for a trip with a driver that closes the road while
+    the first drive is under way, reporting that drive as success or not.
+    """
+    stats = PlannerStats()
+    plan = planner(AND(Fact(road='open')), [Task('trip')], D, repair=repair, stats=stats)
+    executed, road = [], 'open'
+    with pytest.raises(StopException):
+        action = next(plan)
+        while True:
+            executed.append(action)
+            if action == ('drive', ('a',)):
+                road = 'closed'
+            action = plan.send((success or action != ('drive', ('a',)), AND(Fact(road=road))))
+    return executed, stats
+
+
+@pytest.mark.parametrize('success', [False, True])
+def test_repair_redecomposes_only_the_invalidated_subtree(success):
+    executed, stats = drive(repair=True, success=success)
+    assert executed == [('pack', ()), ('label', ()), ('drive', ('a',)), ('walk', ('a',)), ('walk', ('b',))]
+    assert stats.counters['repairs'] == 1 and stats.counters['backtracks'] == 0
+    assert stats.successes['trip/0', 'method'] == 1
+    assert stats.successes['prepare/0', 'method'] == 1
+    assert stats.successes['deliver/0', 'method'] == 2
+
+
+@pytest.mark.parametrize('success', [False, True])
+def test_backtracking_cannot_recover(success):
+    with pytest.raises(FailedPlanException):
+        drive(repair=False, success=success)
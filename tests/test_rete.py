@@ -0,0 +1,86 @@
+import pytest
+from py_plan.pattern_matching import pattern_match
+from shop2.common import V
+from shop2.conditions import AND, NOT, Filter
+from shop2.domain import Method, Operator
+from shop2.fact import Fact
+from shop2.rete import Rete
+from shop2.state import WorkingMemory
+
+PRECONDITIONS = [
+    Fact(value=V('v')) & Fact(value=1),
+    Fact(value=V('v')) & Fact(value=V('w')),
+    Fact(value=V('v')) & Fact(value=V('v')),
+    Fact(value=V('v')) & NOT(Fact(value=1)),
+    Fact(value=V('v')) & Fact(value=V('w')) & Filter(lambda v, w: v < w),
+]
+
+
+def frozen(bindings):
+    return sorted(sorted(theta.items(), key=repr) for theta in bindings)
+
+
+def expected(operator, wm):
+    return frozen(pattern_match(operator.ptconditions[0], wm.index, {}))
+
+
+@pytest.mark.parametrize('preconditions', PRECONDITIONS)
+def test_activations_match_pattern_match(preconditions):
+    operator = Operator(head=('pick',), preconditions=preconditions, effects=[])
+    wm = WorkingMemory(AND(Fact(value=1), Fact(value=2)))
+    rete = Rete({'pick/0': [operator]}, wm)
+    assert frozen(rete.matches(operator, 0, {})) == expected(operator, wm)
+
+
+@pytest.mark.parametrize('preconditions', PRECONDITIONS)
+def test_activations_follow_the_working_memory(preconditions):
+    operator = Operator(head=('pick',), preconditions=preconditions, effects=[])
+    wm = WorkingMemory()
+    rete = Rete({'pick/0': [operator]}, wm)
+    one, two, three = Fact(value=1), Fact(value=2), Fact(value=3)
+    for state in (AND(one), AND(one, two), AND(two, three), AND(one, two, three), AND()):
+        wm.update(state)
+        assert frozen(rete.matches(operator, 0, {})) == expected(operator, wm)
+
+
+HEADED = [
+    Fact(field=V('x'), value=V('vx')) & Fact(field=V('y'), value=V('vy')),
+    Fact(field=V('x'), value=V('v')) & Fact(field=V('y'), value=V('v')),
+    Fact(field=V('x'), value=V('v')) & NOT(Fact(field=V('y'))),
+    Fact(field=V('a'), value=V('va')) & Fact(field=V('b'), value=V('vb')) & Filter(lambda va, vb: va < vb),
+]
+
+
+@pytest.mark.parametrize('preconditions', HEADED)
+def test_head_arguments_follow_the_working_memory(preconditions):
+    method = Method(head=('m', V('x'), V('y')), preconditions=preconditions, subtasks=[])
+    wm = WorkingMemory()
+    rete = Rete({'m/2': [method]}, wm)
+    for values in ((1, 1, 2), (1, 2), (2, 0, 1), (), (0, 1, 2)):
+        wm.update(AND(*[Fact(field=f'f{i}', value=v) for i, v in enumerate(values)]))
+        for x, y in (('f0', 'f1'), ('f1', 'f0'), ('f0', 'f2')):
+            substitutions = {'?x': x, '?y': y}
+            assert rete.supports(method, 0, substitutions)
+            assert (frozen(rete.matches(method, 0, substitutions)) ==
+                    frozen(pattern_match(method.ptconditions[0], wm.index, substitutions)))
+
+
+def test_unconnected_patterns_are_not_joined_into_a_cross_product():
+    add = Method(head=('add', V('a'), V('b'), V('c'), V('d')), subtasks=[],
+                 preconditions=Fact(field=V('a'), value=V('va')) & Fact(field=V('b'), value=V('vb')) &
+                 Fact(field=V('c'), value=V('vc')) & Fact(field=V('d'), value=V('vd')))
+    pick = Method(head=('pick',), subtasks=[],
+                  preconditions=Fact(field=V('w'), value=V('vw')) & Fact(field=V('x'), value=V('vx')) &
+                  Fact(field=V('y'), value=V('vy')) & Fact(field=V('z'), value=V('vz')) &
+                  Filter(lambda w, x, y, z: (w, x, y, z) == ('f0', 'f1', 'f2', 'f3')))
+    wm = WorkingMemory(AND(*[Fact(field=f'f{i}', value=i) for i in range(20)]))
+    rete = Rete({'add/4': [add], 'pick/0': [pick]}, wm)
+    rete.flush()
+    loaded = sum(len(node.tokens) for node in rete.nodes.values())
+    assert loaded <= 2 * 4 * 20
+
+    substitutions = {'?a': 'f0', '?b': 'f1', '?c': 'f2', '?d': 'f3'}
+    assert [(theta['?va'], theta['?vb'], theta['?vc'], theta['?vd'])
+            for theta in rete.matches(add, 0, substitutions)] == [(0, 1, 2, 3)]
+    assert [theta['?w'] for theta in rete.matches(pick, 0, {})] == ['f0']
+    assert sum(len(node.tokens) for node in rete.nodes.values()) == loaded + 1 + 2 * 4
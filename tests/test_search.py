@@ -0,0 +1,61 @@
+import pytest
+from shop2.conditions import AND, NOT
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.search import search, STRATEGIES
+
+START = AND(Fact(start=True))
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_branches_do_not_share_visited_decompositions(strategy):
+    D = {
+        'solve/0': [Method(head=('solve',), preconditions=[], subtasks=[Task('sub'), Task('bad')]),
+                    Method(head=('solve',), preconditions=[], subtasks=[Task('sub'), Task('good')])],
+        'sub/0': [Method(head=('sub',), preconditions=Fact(start=True), subtasks=[Task('foo')])],
+        'foo/0': [Operator(head=('foo',), preconditions=[], effects=Fact(done='foo'))],
+        'bad/0': [Operator(head=('bad',), preconditions=Fact(never=True), effects=[])],
+        'good/0': [Operator(head=('good',), preconditions=[], effects=Fact(done='good'))],
+    }
+    result = search(START, [Task('solve')], D, strategy)
+    assert result is not None and result.actions == [('foo', ()), ('good', ())]
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_every_ordering_of_an_unordered_network_is_tried(strategy):
+    D = {
+        'a/0': [Operator(head=('a',), preconditions=[], effects=[NOT(Fact(ok=True))])],
+        'b/0': [Operator(head=('b',), preconditions=Fact(ok=True), effects=[])],
+    }
+    result = search(AND(Fact(ok=True)), (Task('a'), Task('b')), D, strategy)
+    assert result is not None and result.actions == [('b', ()), ('a', ())]
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_finds_the_cheapest_plan(strategy):
+    D = {
+        'go/0': [Method(head=('go',), preconditions=[], subtasks=[Task('walk'), Task('walk')]),
+                 Method(head=('go',), preconditions=[], subtasks=[Task('ride')], cost=0)],
+        'walk/0': [Operator(head=('walk',), preconditions=[], effects=[], cost=1)],
+        'ride/0': [Operator(head=('ride',), preconditions=[], effects=[], cost=5)],
+    }
+    result = search(START, [Task('go')], D, strategy)
+    assert result.actions == [('walk', ()), ('walk', ())] and result.cost == 3
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_recursion_without_progress_terminates(strategy):
+    D = {'loop/0': [Method(head=('loop',), preconditions=[], subtasks=[Task('loop')])]}
+    assert search(START, [Task('loop')], D, strategy) is None
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_unordered_compound_tasks_keep_every_operator_order(strategy):
+    D = {
+        'first/0': [Method(head=('first',), preconditions=[], subtasks=[Task('a')])],
+        'second/0': [Method(head=('second',), preconditions=[], subtasks=[Task('b')])],
+        'a/0': [Operator(head=('a',), preconditions=[], effects=[NOT(Fact(ok=True))])],
+        'b/0': [Operator(head=('b',), preconditions=Fact(ok=True), effects=[])],
+    }
+    result = search(AND(Fact(ok=True)), (Task('first'), Task('second')), D, strategy)
+    assert result is not None and result.actions == [('b', ()), ('a', ())]
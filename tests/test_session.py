@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from shop2.common import V, PAUSE
+from shop2.conditions import AND, Filter
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.planner import planner, FailedPlanException, StopException
+from shop2.session import PlanningSession
+
+N = 1000
+STATE = AND(*[Fact(item=i) for i in range(N)])
+D = {
+    'take/0': [Operator(head=('take',), preconditions=Fact(item=V('i')), effects=Fact(taken=V('i')))],
+    'pick/0': [Method(head=('pick',), preconditions=Fact(item=V('i')), subtasks=[Task('take')])],
+}
+
+
+def pauses(tasks, match):
+    generator = planner(STATE, tasks, D, simulate=True, pause=0, match=match)
+    count = 0
+    try:
+        while True:
+            assert generator.send(None) is PAUSE
+            count += 1
+    except StopException as e:
+        return count, e.actions
+
+
+def test_pauses_inside_a_long_operator_match():
+    count, actions = pauses([Task('take')], 'random')
+    assert count > N // 64 and len(actions) == 1
+
+
+def test_pauses_inside_a_long_method_match():
+    count, actions = pauses([Task('pick')], 'random')
+    assert count > N // 64 and len(actions) == 1
+
+
+def test_sessions_share_the_event_loop():
+    async def main():
+        sessions = [PlanningSession(STATE, [Task('pick')], D, pause=0, simulate=True, match='first')
+                    for _ in range(3)]
+        return await asyncio.gather(*(session.run() for session in sessions))
+    assert asyncio.run(main()) == [[('take', ())]] * 3
+
+
+@pytest.mark.parametrize('rete', [False, True])
+def test_other_sessions_progress_during_a_fruitless_join(rete):
+    state = AND(*[Fact(**{attr: i}) for attr in 'abc' for i in range(20)])
+    domain = {'hard/0': [Method(head=('hard',), subtasks=[],
+                                preconditions=Fact(a=V('x')) & Fact(b=V('y')) & Fact(c=V('z'))
+                                & Filter(lambda x, y, z: False))]}
+
+    async def main():
+        session = PlanningSession(state, [Task('hard')], domain, pause=0, simulate=True, rete=rete)
+        hard = asyncio.ensure_future(session.run())
+        ticks = 0
+        while not hard.done():
+            ticks += 1
+            await asyncio.sleep(0)
+        with pytest.raises(FailedPlanException):
+            hard.result()
+        return ticks
+    assert asyncio.run(main()) > 20
@@ -0,0 +1,37 @@
+from shop2.conditions import AND
+from shop2.fact import Fact
+from shop2.state import StateFingerprint, WorkingMemory
+
+FACTS = [Fact(at='home'), Fact(item='a'), Fact(item='b', count=2)]
+
+
+def test_fingerprint_does_not_depend_on_order_or_identity():
+    value = StateFingerprint(AND(*FACTS)).value
+    assert StateFingerprint(AND(*reversed(FACTS))).value == value
+    assert StateFingerprint(AND(Fact(item='b', count=2), Fact(at='home'), Fact(item='a'))).value == value
+    assert StateFingerprint(AND(*FACTS[:2])).value != value
+
+
+def test_fingerprint_is_stable_across_add_and_remove():
+    fingerprint = StateFingerprint(AND(*FACTS))
+    value = fingerprint.value
+    extra = Fact(item='c')
+    assert fingerprint.update(AND(*FACTS, extra)) == ([extra], [])
+    assert fingerprint.value != value
+    assert fingerprint.update(AND(*FACTS[1:])) == ([], [FACTS[0], extra])
+    assert fingerprint.update(AND(FACTS[0], *FACTS[1:])) == ([FACTS[0]], [])
+    assert fingerprint.value == value
+
+
+def test_duplicate_facts_do_not_cancel_out():
+    assert StateFingerprint(AND(Fact(item='a'), Fact(item='a'))).value != StateFingerprint(AND()).value
+
+
+def test_working_memory_applies_only_the_delta():
+    wm = WorkingMemory(AND(*FACTS))
+    index = {key: dict(bucket) for key, bucket in wm.index.items()}
+    extra = Fact(item='c')
+    assert wm.update(AND(*FACTS, extra)) == ([extra], [])
+    assert wm.update(AND(*FACTS)) == ([], [extra])
+    assert {key: dict(bucket) for key, bucket in wm.index.items()} == index
+    assert wm.fingerprint.value == StateFingerprint(AND(*reversed(FACTS))).value
@@ -0,0 +1,60 @@
+from shop2.common import V
+from shop2.conditions import AND, NOT
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.templates import PlanTemplates
+
+D = {
+    'move/2': [Operator(head=('move', V('x'), V('to')),
+                        preconditions=Fact(obj=V('x'), at=V('from')) & Fact(place=V('to'), kind='room'),
+                        effects=[NOT(Fact(obj=V('x'), at=V('from'))), Fact(obj=V('x'), at=V('to'))])],
+    'inc/0': [Operator(head=('inc',), preconditions=Fact(count=V('c')),
+                       effects=[NOT(Fact(count=V('c'))), Fact(count=(lambda c: c + 1, V('c')))])],
+    'ring/0': [Operator(head=('ring',), preconditions=Fact(count=2), effects=Fact(rang=True))],
+    'wait/0': [Operator(head=('wait',), preconditions=[], effects=Fact(waited=True))],
+    'finish/0': [Method(head=('finish',), preconditions=Fact(count=V('c')), subtasks=[Task('inc'), Task('ring')]),
+                 Method(head=('finish',), preconditions=Fact(count=V('c')), subtasks=[Task('wait')])],
+    'travel/2': [Method(head=('travel', 'north', V('to')), preconditions=[], subtasks=[Task('go', V('to'))]),
+                 Method(head=('travel', V('d'), V('to')), preconditions=[], subtasks=[Task('walk', V('d'), V('to'))])],
+    'go/1': [Operator(head=('go', V('to')), preconditions=[], effects=Fact(at=V('to')))],
+    'walk/2': [Operator(head=('walk', V('d'), V('to')), preconditions=[], effects=Fact(at=V('to')))],
+}
+
+
+def rooms(obj, start, goal, kind='room'):
+    return AND(Fact(obj=obj, at=start), Fact(place=start, kind=kind), Fact(place=goal, kind=kind))
+
+
+def test_hit_substitutes_the_untested_constants():
+    templates = PlanTemplates(D)
+    assert templates.find_plan(rooms('box', 'hall', 'attic'), [Task('move', 'box', 'attic')]) == \
+        [('move', ('box', 'attic'))]
+    assert templates.find_plan(rooms('crate', 'cellar', 'porch'), [Task('move', 'crate', 'porch')]) == \
+        [('move', ('crate', 'porch'))]
+    assert (templates.hits, templates.misses, templates.invalid, len(templates)) == (1, 1, 0, 1)
+
+
+def test_invalid_instantiation_is_replanned():
+    templates = PlanTemplates(D)
+    assert templates.find_plan(AND(Fact(count=1)), [Task('finish')]) == [('inc', ()), ('ring', ())]
+    # count=7 has the same signature, but after inc the count is 8, not 2.
+    assert templates.find_plan(AND(Fact(count=7)), [Task('finish')]) == [('wait', ())]
+    assert (templates.hits, templates.misses, templates.invalid) == (0, 1, 1)
+    assert templates.find_plan(AND(Fact(count=9)), [Task('finish')]) == [('wait', ())]
+    assert templates.hits == 1
+
+
+def test_tested_constants_are_part_of_the_signature():
+    templates = PlanTemplates(D)
+    templates.find_plan(rooms('box', 'hall', 'attic'), [Task('move', 'box', 'attic')])
+    # Only kind='room' differs, and the preconditions test it.
+    yard = AND(Fact(obj='box', at='hall'), Fact(place='hall', kind='yard'), Fact(place='attic', kind='room'))
+    assert templates.find_plan(yard, [Task('move', 'box', 'attic')]) == [('move', ('box', 'attic'))]
+    assert (templates.hits, templates.misses, len(templates)) == (0, 2, 2)
+
+
+def test_head_constants_are_part_of_the_signature():
+    templates = PlanTemplates(D)
+    assert templates.find_plan(AND(), [Task('travel', 'north', 'school')]) == [('go', ('school',))]
+    assert templates.find_plan(AND(), [Task('travel', 'west', 'school')]) == [('walk', ('west', 'school'))]
+    assert (templates.hits, templates.misses) == (0, 2)
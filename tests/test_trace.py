@@ -0,0 +1,48 @@
+import json
+from shop2.common import V
+from shop2.conditions import AND
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.planner import find_plan
+from shop2.trace import Tracer
+
+D = {
+    'go/1': [Method(head=('go', V('to')), preconditions=[], subtasks=[Task('fly', V('to'))]),
+             Method(head=('go', V('to')), preconditions=[], subtasks=[Task('walk', V('to'))])],
+    'fly/1': [Operator(head=('fly', V('to')), preconditions=Fact(airport=True), effects=Fact(at=V('to')))],
+    'walk/1': [Operator(head=('walk', V('to')), preconditions=[], effects=Fact(at=V('to')))],
+}
+
+
+def spans(events):
+    """
+    Pairs the B and E events of a trace into (path, name, args) spans, where
+    path holds the names of the enclosing spans, and checks they balance.
+    """
+    stack, found = [], []
+    for event in events:
+        if event['ph'] == 'B':
+            stack.append(event)
+        else:
+            assert event['ph'] == 'E' and stack
+            begin = stack.pop()
+            assert begin['ts'] <= event['ts']
+            found.append((tuple(e['name'] for e in stack), begin['name'], {**begin['args'], **event['args']}))
+    assert not stack
+    return found
+
+
+def test_trace_records_failed_attempts_under_their_tasks(tmp_path):
+    tracer = Tracer()
+    assert find_plan(AND(Fact(at='home')), [Task('go', 'park')], D, tracer=tracer) == [('walk', ('park',))]
+    tracer.write(tmp_path / 'trace.json')
+    with open(tmp_path / 'trace.json') as f:
+        found = spans(json.load(f)['traceEvents'])
+
+    outcomes = [(path, name, args.get('outcome')) for path, name, args in found]
+    assert (('go(park)',), '<Method go>', 'decomposed') in outcomes
+    assert (('go(park)',), '<Method go>', 'exhausted') in outcomes
+    assert (('go(park)', 'fly(park)'), '<Operator fly>', 'inapplicable') in outcomes
+    assert (('go(park)', 'walk(park)'), '<Operator walk>', 'applied') in outcomes
+    assert any(name == 'backtrack' for _, name, _ in found)
+    assert {args['node'] for path, name, args in found if name == 'go(park)'} == {0}
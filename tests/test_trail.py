@@ -0,0 +1,50 @@
+from shop2.common import V
+from shop2.conditions import AND
+from shop2.domain import Task, Method, Operator
+from shop2.fact import Fact
+from shop2.planner import find_plan
+from shop2.trail import Trail, ChoicePoint
+
+
+def test_pop_undoes_entries_recorded_since_the_choice_point():
+    trail, log = Trail(), []
+    trail.record(log.append, 'lost')  # nothing to return to yet
+    trail.push(ChoicePoint(None, None))
+    trail.record(log.append, 'a')
+    trail.push(ChoicePoint(None, None))
+    trail.record(log.append, 'b')
+    trail.record(log.append, 'c')
+
+    trail.pop()
+    assert log == ['c', 'b']
+    trail.pop()
+    assert log == ['c', 'b', 'a']
+    assert not trail
+
+
+def test_backtracking_restores_the_plan_and_state():
+    D = {
+        'solve/0': [Method(head=('solve',), preconditions=[],
+                           subtasks=[Task('mark', 'x'), Task('check', 'y')]),
+                    Method(head=('solve',), preconditions=[],
+                           subtasks=[Task('mark', 'y'), Task('check', 'y')])],
+        'mark/1': [Operator(head=('mark', V('o')), preconditions=[],
+                            effects=Fact(marked=V('o')))],
+        'check/1': [Operator(head=('check', V('o')), preconditions=Fact(marked=V('o')),
+                             effects=[])],
+    }
+    for _ in range(10):
+        assert find_plan(AND(Fact(start=True)), [Task('solve')], D) == [
+            ('mark', ('y',)), ('check', ('y',))]
+
+
+def test_backtracking_tries_the_other_tasks_that_could_come_first():
+    D = {
+        'a/0': [Method(head=('a',), preconditions=Fact(done='b'), subtasks=[Task('finish')])],
+        'b/0': [Operator(head=('b',), preconditions=[], effects=Fact(done='b'))],
+        'finish/0': [Operator(head=('finish',), preconditions=[], effects=Fact(done='a'))],
+    }
+    for match in ('random', 'first'):
+        for _ in range(50):
+            assert find_plan(AND(Fact(start=True)), [(Task('a'), Task('b'))], D, match=match) == \
+                [('b', ()), ('finish', ())]
@@ -0,0 +1,64 @@
+import pytest
+from shop2.common import V
+from shop2.conditions import AND, NOT
+from shop2.domain import Task, Operator
+from shop2.fact import Fact
+from shop2.planner import planner, StopException
+from shop2.search import STRATEGIES
+from shop2.state import iter_facts
+from shop2.validate import validate
+
+STATE = AND(Fact(item='a'), Fact(item='b'), Fact(item='c'), Fact(at='home'))
+D = {
+    # The head constant is part of the action, and take's effects depend on
+    # a binding that the action (take,) does not show.
+    'go/2': [Operator(head=('go', 'north', V('to')), preconditions=Fact(at=V('from')),
+                      effects=[NOT(Fact(at=V('from'))), Fact(at=V('to'))])],
+    'take/0': [Operator(head=('take',), preconditions=Fact(item=V('i')),
+                        effects=[NOT(Fact(item=V('i'))), Fact(taken=V('i'))])],
+}
+
+
+def run(tasks, **kwargs):
+    with pytest.raises(StopException) as e:
+        for _ in planner(STATE, tasks, D, simulate=True, **kwargs):
+            pass
+    return e.value
+
+
+def contents(state):
+    return sorted(sorted(fact.items(), key=str) for fact in iter_facts(state))
+
+
+def test_ground_keeps_head_constants():
+    operator = D['go/2'][0]
+    assert operator.ground({'?to': 'school', '?from': 'home'}) == ('go', ('north', 'school'))
+
+
+@pytest.mark.parametrize('strategy', ('dfs',) + STRATEGIES)
+def test_recorded_bindings_validate_exactly(strategy):
+    e = run([Task('go', 'north', 'school'), Task('take'), Task('take')], strategy=strategy)
+    assert e.actions[0] == ('go', ('north', 'school'))
+    result = validate(e.actions, STATE, D, e.plan, e.bindings)
+    assert result.valid and contents(result.state) == contents(e.state)
+
+
+def test_actions_that_do_not_determine_their_effects_are_rejected():
+    e = run([Task('go', 'north', 'school'), Task('take')])
+    result = validate(e.actions, STATE, D)
+    assert not result.valid and result.step == 1 and 'does not record' in result.message
+    assert validate(e.actions[:1], STATE, D).valid
+
+
+def test_recorded_bindings_must_hold():
+    e = run([Task('take')])
+    bindings = [{**e.bindings[0], '?i': 'z'}]
+    result = validate(e.actions, STATE, D, e.plan, bindings)
+    assert not result.valid and result.step == 0 and 'does not apply' in result.message
+
+
+def test_failing_step_is_reported_with_the_state_before_it():
+    actions = [('go', ('north', 'school')), ('go', ('north', 'park'))]
+    assert validate(actions, STATE, D).valid
+    result = validate([('go', ('south', 'school'))], STATE, D)
+    assert not result.valid and result.step == 0 and contents(result.state) == contents(STATE)